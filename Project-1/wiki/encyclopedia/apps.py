@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class EncyclopediaConfig(AppConfig):
     name = 'encyclopedia'
+
+    def ready(self):
+        # Connect the caches and indexes that listen for saved entries
+        from . import fulltext, links, rendering, titles  # noqa: F401
@@ -0,0 +1,248 @@
+import heapq
+import math
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.dispatch import receiver
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+from . import indexdb, util
+from .signals import entry_saved
+
+
+# BM25 tuning parameters
+K1 = 1.2
+B = 0.75
+
+# Most query terms scored per search, rarest first
+MAX_QUERY_TERMS = 10
+
+_token_re = re.compile(r"\w+")
+
+
+def tokenize(text):
+    """
+    Returns the list of lowercase word tokens in the given text.
+    """
+    return _token_re.findall(text.lower())
+
+
+def _term_ids(conn, terms, create=False):
+    """
+    Returns a dict mapping each of the given terms to its id, optionally
+    adding terms that aren't in the index yet.
+    """
+    terms = list(terms)
+    if create:
+        conn.executemany("INSERT OR IGNORE INTO terms (term) VALUES (?)",
+                         ((term,) for term in terms))
+    ids = {}
+    for i in range(0, len(terms), 500):
+        chunk = terms[i:i + 500]
+        placeholders = ",".join("?" * len(chunk))
+        ids.update((term, term_id) for term_id, term in conn.execute(
+            f"SELECT id, term FROM terms WHERE term IN ({placeholders})", chunk))
+    return ids
+
+
+def _remove_document(conn, title):
+    row = conn.execute("SELECT id, length FROM documents WHERE title = ?",
+                       (title,)).fetchone()
+    if row is None:
+        return
+    doc_id, length = row
+    conn.execute("UPDATE terms SET df = df - 1 WHERE id IN "
+                 "(SELECT term_id FROM postings WHERE doc_id = ?)", (doc_id,))
+    conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+    conn.execute("DELETE FROM documents WHERE id = ?", (doc_id,))
+    conn.execute("UPDATE stats SET doc_count = doc_count - 1, "
+                 "total_length = total_length - ?", (length,))
+
+
+def _impact(tf, length, reference_length):
+    """
+    Returns the BM25 weight of a term occurring tf times in a document of
+    the given length, without the term's idf. Lengths are normalised against
+    the average length recorded when the index was last rebuilt, so the
+    weight can be stored with the posting.
+    """
+    norm = K1 * (1 - B + B * length / reference_length) if reference_length else K1
+    return tf * (K1 + 1) / (tf + norm)
+
+
+def _add_document(conn, title, content, stamp):
+    counts = Counter(tokenize(content))
+    length = sum(counts.values())
+    mtime, size = stamp or (0, 0)
+    # Until wiki_reindex records a reference length, documents are weighed
+    # against the current average length rather than their own
+    reference_length, total_length, doc_count = conn.execute(
+        "SELECT reference_length, total_length, doc_count FROM stats").fetchone()
+    if not reference_length and doc_count > 0:
+        reference_length = total_length / doc_count
+    doc_id = conn.execute(
+        "INSERT INTO documents (title, length, mtime, size) VALUES (?, ?, ?, ?)",
+        (title, length, mtime, size)).lastrowid
+    ids = _term_ids(conn, counts, create=True)
+    conn.executemany("INSERT INTO postings (term_id, doc_id, impact) VALUES (?, ?, ?)",
+                     ((ids[term], doc_id, _impact(tf, length, reference_length or length))
+                      for term, tf in counts.items()))
+    conn.executemany("UPDATE terms SET df = df + 1 WHERE id = ?",
+                     ((term_id,) for term_id in ids.values()))
+    conn.execute("UPDATE stats SET doc_count = doc_count + 1, "
+                 "total_length = total_length + ?", (length,))
+
+
+def index_entry(title, content):
+    """
+    Adds an entry to the full-text index, replacing any earlier version.
+    Stores that index their own content are left alone.
+    """
+    if util.get_store().supports_search:
+        return
+    with indexdb.transaction() as conn:
+        _remove_document(conn, title)
+        _add_document(conn, title, content, util.entry_stamp(title))
+
+
+def rebuild(full=False):
+    """
+    Brings the full-text index up to date with the entries directory and
+    returns the number of entries (re)indexed. Unless full is True, entries
+    whose file hasn't changed since they were last indexed are skipped. A
+    full rebuild, or the first build, reads every entry twice: once to find
+    the average entry length that stored weights are normalised against.
+    """
+    if util.get_store().supports_search:
+        return 0
+    conn = indexdb.connect()
+    titles = util.list_entries()
+    with conn:
+        if full:
+            conn.execute("DELETE FROM postings")
+            conn.execute("DELETE FROM documents")
+            conn.execute("DELETE FROM terms")
+            conn.execute("UPDATE stats SET doc_count = 0, total_length = 0, "
+                         "reference_length = 0")
+        reference_length, = conn.execute("SELECT reference_length FROM stats").fetchone()
+        if not reference_length:
+            lengths = [len(tokenize(util.get_entry(title) or "")) for title in titles]
+            reference_length = sum(lengths) / len(lengths) if lengths else 0
+            conn.execute("UPDATE stats SET reference_length = ?", (reference_length,))
+        indexed = {title: (mtime, size) for title, mtime, size in
+                   conn.execute("SELECT title, mtime, size FROM documents")}
+        for title in set(indexed) - set(titles):
+            _remove_document(conn, title)
+        count = 0
+        for title in titles:
+            stamp = util.entry_stamp(title)
+            if stamp is None or indexed.get(title) == stamp:
+                continue
+            content = util.get_entry(title)
+            if content is None:
+                continue
+            _remove_document(conn, title)
+            _add_document(conn, title, content, stamp)
+            count += 1
+    return count
+
+
+def _postings_limit():
+    return getattr(settings, "WIKI_SEARCH_POSTINGS_LIMIT", 1000)
+
+
+def search(query, limit=20):
+    """
+    Returns up to limit (title, score) pairs for the entries whose bodies
+    best match the query, ranked by BM25. Stores with their own full-text
+    index answer the query themselves.
+
+    Postings are read in order of their stored weight, and only the
+    strongest WIKI_SEARCH_POSTINGS_LIMIT of each term are scored, so the
+    cost of a query doesn't grow with the number of entries. Terms found in
+    more than half of the entries are ignored unless nothing else is left,
+    as they say little about relevance, and only the MAX_QUERY_TERMS rarest
+    terms are used. The index is filled by
+    wiki_reindex; until then, searches find nothing.
+    """
+    store = util.get_store()
+    if store.supports_search:
+        return store.search(query, limit)
+    terms = set(tokenize(query))
+    if not terms:
+        return []
+    conn = indexdb.connect()
+    doc_count, = conn.execute("SELECT doc_count FROM stats").fetchone()
+    if doc_count <= 0:
+        return []
+
+    terms = sorted(terms)[:500]
+    placeholders = ",".join("?" * len(terms))
+    rows = conn.execute(f"SELECT id, df FROM terms WHERE term IN ({placeholders}) "
+                        "AND df > 0 ORDER BY df", terms).fetchall()
+    rare = [row for row in rows if row[1] <= doc_count / 2]
+    rows = (rare or rows)[:MAX_QUERY_TERMS]
+
+    scores = Counter()
+    for term_id, df in rows:
+        idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+        for doc_id, impact in conn.execute(
+                "SELECT doc_id, impact FROM postings WHERE term_id = ? "
+                "ORDER BY impact DESC LIMIT ?", (term_id, _postings_limit())):
+            scores[doc_id] += idf * impact
+
+    top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+    titles = {}
+    if top:
+        placeholders = ",".join("?" * len(top))
+        titles = dict(conn.execute(
+            f"SELECT id, title FROM documents WHERE id IN ({placeholders})",
+            [doc_id for doc_id, _ in top]))
+    return [(titles[doc_id], score) for doc_id, score in top if doc_id in titles]
+
+
+def snippet(text, query, width=160):
+    """
+    Returns an HTML-safe excerpt of text around the first query term, with
+    every occurrence of a query term wrapped in <mark>.
+    """
+    terms = sorted(set(tokenize(query)), key=len, reverse=True)
+    if not terms:
+        return escape(text[:width])
+    # Terms are plain word tokens and are escaped, so this pattern can't
+    # backtrack on user input
+    pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, terms)) + r")\b",
+                         re.IGNORECASE)
+    match = pattern.search(text)
+    start = max(0, match.start() - width // 4) if match else 0
+    excerpt = " ".join(text[start:start + width].split())
+
+    parts = ["&hellip;" if start > 0 else ""]
+    position = 0
+    for match in pattern.finditer(excerpt):
+        parts.append(escape(excerpt[position:match.start()]))
+        parts.append(format_html("<mark>{}</mark>", match.group()))
+        position = match.end()
+    parts.append(escape(excerpt[position:]))
+    if start + width < len(text):
+        parts.append("&hellip;")
+    return mark_safe("".join(parts))
+
+
+def search_with_snippets(query, limit=20):
+    """
+    Returns up to limit (title, snippet) pairs for the best matching entries.
+    """
+    results = []
+    for title, _ in search(query, limit):
+        content = util.get_entry(title)
+        if content is not None:
+            results.append((title, snippet(content, query)))
+    return results
+
+
+@receiver(entry_saved)
+def _entry_saved(sender, title, content, **kwargs):
+    index_entry(title, content)
@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+# Tables used by the on-disk search and link indexes. Every statement is idempotent so
+# the schema is created the first time a process opens the index file.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    title TEXT NOT NULL UNIQUE,
+    length INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    term TEXT NOT NULL UNIQUE,
+    df INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term_id INTEGER NOT NULL,
+    doc_id INTEGER NOT NULL,
+    impact REAL NOT NULL,
+    PRIMARY KEY (term_id, impact DESC, doc_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    doc_count INTEGER NOT NULL,
+    total_length INTEGER NOT NULL,
+    reference_length REAL NOT NULL DEFAULT 0
+);
+INSERT OR IGNORE INTO stats VALUES (0, 0, 0, 0);
+CREATE TABLE IF NOT EXISTS links (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    PRIMARY KEY (source, target)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS links_target ON links (target);
+CREATE TABLE IF NOT EXISTS link_changes (
+    target TEXT PRIMARY KEY,
+    changed INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Bumped whenever the layout of the full-text tables changes. Index files
+# written by an older version have those tables dropped and recreated
+# empty, to be refilled by wiki_reindex.
+SCHEMA_VERSION = 3
+FULLTEXT_TABLES = ["postings", "terms", "documents", "stats"]
+
+_local = threading.local()
+
+
+def path():
+    """
+    Returns the filesystem path of the index database.
+    """
+    return settings.WIKI_INDEX_DB
+
+
+def connect():
+    """
+    Returns this thread's connection to the index database, opening it
+    and creating the schema on first use.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != path():
+        conn = sqlite3.connect(path(), timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+            with conn:
+                for table in FULLTEXT_TABLES:
+                    conn.execute(f"DROP TABLE IF EXISTS {table}")
+                conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+        _local.path = path()
+    return conn
+
+
+@contextmanager
+def transaction():
+    """
+    Runs the block in a transaction on this thread's connection and yields
+    the connection. Blocks nested inside it join the outer transaction,
+    which commits once at the end, so a batch of saves shares one commit.
+    """
+    conn = connect()
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    try:
+        if depth:
+            yield conn
+        else:
+            with conn:
+                yield conn
+    finally:
+        _local.depth = depth
@@ -0,0 +1,131 @@
+import re
+import time
+from urllib.parse import unquote
+
+from django.dispatch import receiver
+
+from . import indexdb, titles, util
+from .signals import entry_saved
+
+
+# Inline links and reference definitions pointing at /wiki/<title>
+_link_re = re.compile(r"(?:\]\(|^\s*\[[^\]\n]+\]:)\s*<?/wiki/([^)\s>/#?]+)", re.MULTILINE)
+
+
+def extract_links(content):
+    """
+    Returns the set of normalized titles that an entry's Markdown links to.
+    """
+    return {titles.normalize(unquote(target)) for target in _link_re.findall(content)}
+
+
+def _touch(conn, targets):
+    # Records when the backlinks of each target last changed
+    now = time.time_ns()
+    conn.executemany("INSERT OR REPLACE INTO link_changes (target, changed) VALUES (?, ?)",
+                     ((target, now) for target in targets))
+
+
+def _set_links(conn, title, targets):
+    # Links from a page to itself don't count as backlinks
+    targets = targets - {titles.normalize(title)}
+    old = {target for target, in conn.execute(
+        "SELECT target FROM links WHERE source = ?", (title,))}
+    if old == targets:
+        return
+    _touch(conn, old ^ targets)
+    conn.execute("DELETE FROM links WHERE source = ?", (title,))
+    conn.executemany("INSERT INTO links (source, target) VALUES (?, ?)",
+                     ((title, target) for target in targets))
+
+
+def index_entry(title, content):
+    """
+    Replaces the outgoing links recorded for an entry.
+    """
+    with indexdb.transaction() as conn:
+        _set_links(conn, title, extract_links(content))
+
+
+def rebuild():
+    """
+    Re-extracts the links of every entry and returns the number of entries
+    read.
+    """
+    conn = indexdb.connect()
+    count = 0
+    with conn:
+        sources = set()
+        for title in util.list_entries():
+            content = util.get_entry(title)
+            if content is not None:
+                _set_links(conn, title, extract_links(content))
+                sources.add(title)
+                count += 1
+        # Drop the links of entries that no longer exist
+        stale = [(source, target) for source, target in
+                 conn.execute("SELECT source, target FROM links") if source not in sources]
+        _touch(conn, {target for _, target in stale})
+        conn.executemany("DELETE FROM links WHERE source = ?",
+                         {(source,) for source, _ in stale})
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('links_built', '1')")
+    return count
+
+
+def is_built():
+    """
+    Returns whether the link graph has been built by rebuild(). Until then
+    backlinks() and orphans() return nothing rather than reading every
+    entry inside a request; wiki_reindex builds it.
+    """
+    conn = indexdb.connect()
+    return conn.execute("SELECT 1 FROM meta WHERE key = 'links_built'").fetchone() is not None
+
+
+def backlinks(title):
+    """
+    Returns the sorted titles of the entries that link to the given entry,
+    or an empty list if the link graph hasn't been built yet.
+    """
+    if not is_built():
+        return []
+    conn = indexdb.connect()
+    return [source for source, in conn.execute(
+        "SELECT source FROM links WHERE target = ? ORDER BY source",
+        (titles.normalize(title),))]
+
+
+def backlink_state(title):
+    """
+    Returns a (backlinks, changed) pair for an entry: the sorted titles of
+    the entries linking to it, as backlinks() returns them, and when, in
+    nanoseconds since the epoch, it last gained or lost a backlink (None if
+    it never has).
+    """
+    conn = indexdb.connect()
+    target = titles.normalize(title)
+    built, changed = conn.execute(
+        "SELECT EXISTS (SELECT 1 FROM meta WHERE key = 'links_built'), "
+        "(SELECT changed FROM link_changes WHERE target = ?)", (target,)).fetchone()
+    if not built:
+        return [], changed
+    return [source for source, in conn.execute(
+        "SELECT source FROM links WHERE target = ? ORDER BY source", (target,))], changed
+
+
+def orphans():
+    """
+    Returns the sorted titles of the entries that no other entry links to,
+    or an empty list if the link graph hasn't been built yet.
+    """
+    if not is_built():
+        return []
+    conn = indexdb.connect()
+    linked = {target for target, in conn.execute(
+        "SELECT DISTINCT target FROM links")}
+    return [title for title in util.list_entries() if titles.normalize(title) not in linked]
+
+
+@receiver(entry_saved)
+def _entry_saved(sender, title, content, **kwargs):
+    index_entry(title, content)
@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client, override_settings
+
+from encyclopedia import fulltext, links, titles, util
+
+
+WORDS = (
+    "web framework python language markup style sheet browser server request "
+    "response template model view database query index cache render page link "
+    "title content history version network protocol client script function class "
+    "module package library compiler runtime memory thread process file system"
+).split()
+
+
+def make_title(rng, i):
+    return f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS).capitalize()} {i}"
+
+
+def make_entry(rng, title, all_titles):
+    """
+    Returns a Markdown entry with headings, paragraphs, lists, links to
+    other entries and a code block.
+    """
+    lines = [f"# {title}", ""]
+    for section in range(rng.randint(1, 4)):
+        lines.append(f"## {rng.choice(WORDS).capitalize()} {section}")
+        lines.append("")
+        for _ in range(rng.randint(1, 3)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(20, 80))]
+            words[rng.randrange(len(words))] = f"**{rng.choice(WORDS)}**"
+            target = rng.choice(all_titles)
+            words.append(f"[{target}](/wiki/{target})")
+            lines.append(" ".join(words) + ".")
+            lines.append("")
+        lines.extend(f"* {rng.choice(WORDS)} {rng.choice(WORDS)}" for _ in range(3))
+        lines.append("")
+    lines.extend(["```", f"print({rng.choice(WORDS)!r})", "```", ""])
+    return "\n".join(lines)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def peak_rss_kb():
+    """
+    Returns the peak resident set size of this process in kilobytes.
+    ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def summarize(samples):
+    total = sum(samples)
+    return {
+        "requests": len(samples),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 3),
+        "throughput_rps": round(len(samples) / total, 1) if total else None,
+    }
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks the wiki views against synthetic corpora and prints "
+            "latency percentiles, throughput and peak RSS as JSON.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                            help="Corpus sizes to benchmark.")
+        parser.add_argument("--requests", type=int, default=200,
+                            help="Requests per view and corpus.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        # Benchmarks one generated corpus directory; used internally to run
+        # each corpus in a process of its own
+        parser.add_argument("--corpus", help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options["corpus"]:
+            result = self.bench_corpus(options["corpus"], options["requests"], options["seed"])
+            self.stdout.write(json.dumps(result))
+            return
+
+        report = {"commit": self.commit(), "corpora": []}
+        for size in options["sizes"]:
+            self.stderr.write(f"Benchmarking {size} entries...")
+            report["corpora"].append(self.run_corpus(size, options["requests"], options["seed"]))
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output)
+        self.stdout.write(output)
+
+    def commit(self):
+        try:
+            return subprocess.run(["git", "rev-parse", "HEAD"], cwd=settings.BASE_DIR,
+                                  capture_output=True, text=True).stdout.strip() or None
+        except OSError:
+            return None
+
+    def run_corpus(self, size, requests, seed):
+        """
+        Generates a corpus and benchmarks it in a child process, so that its
+        peak RSS covers only indexing and serving that corpus, not the
+        corpora before it or the generation of this one.
+        """
+        rng = random.Random(seed)
+        root = tempfile.mkdtemp(prefix="wiki-bench-")
+        try:
+            start = time.monotonic()
+            self.generate(rng, root, size)
+            generate_s = round(time.monotonic() - start, 2)
+
+            child = subprocess.run(
+                [sys.executable, os.path.join(settings.BASE_DIR, "manage.py"), "wiki_bench",
+                 "--corpus", root, "--requests", str(requests), "--seed", str(seed)],
+                stdout=subprocess.PIPE, text=True, check=True)
+            result = json.loads(child.stdout)
+            result["setup"]["generate_s"] = generate_s
+            return {"entries": size, **result}
+        finally:
+            shutil.rmtree(root, ignore_errors=True)
+
+    def bench_corpus(self, root, requests, seed):
+        rng = random.Random(seed)
+        with override_settings(MEDIA_ROOT=root,
+                               ALLOWED_HOSTS=["testserver"],
+                               WIKI_ENTRY_STORE="encyclopedia.stores.FileSystemStore",
+                               WIKI_ENTRY_STORE_OPTIONS={},
+                               WIKI_INDEX_DB=os.path.join(root, "index.sqlite3")):
+            start = time.monotonic()
+            fulltext.rebuild()
+            links.rebuild()
+            titles.warm()
+            setup = {"index_s": round(time.monotonic() - start, 2)}
+
+            views = self.run_views(rng, util.list_entries(), requests)
+            return {
+                "setup": setup,
+                "views": views,
+                "peak_rss_kb": peak_rss_kb(),
+            }
+
+    def generate(self, rng, root, size):
+        os.makedirs(os.path.join(root, "entries"))
+        all_titles = [make_title(rng, i) for i in range(size)]
+        for title in all_titles:
+            with open(os.path.join(root, "entries", f"{title}.md"), "w") as f:
+                f.write(make_entry(rng, title, all_titles))
+        return all_titles
+
+    def run_views(self, rng, all_titles, requests):
+        client = Client()
+        created = 0
+
+        def create():
+            nonlocal created
+            created += 1
+            return client.post("/wiki/create/", {
+                "title": f"Bench Page {created}",
+                "contents": make_entry(rng, f"Bench Page {created}", all_titles),
+            })
+
+        scenarios = {
+            "index": lambda: client.get("/wiki/"),
+            "entry": lambda: client.get(f"/wiki/{rng.choice(all_titles)}/"),
+            "search": lambda: client.get("/wiki/search/", {
+                "q": rng.choice([rng.choice(WORDS), rng.choice(all_titles)[:6]])}),
+            "random_entry": lambda: client.get("/wiki/random_entry/"),
+            "create": create,
+            "edit": lambda: client.post(f"/wiki/{rng.choice(all_titles)}/edit", {
+                "contents": make_entry(rng, "Edited", all_titles)}),
+        }
+        results = {}
+        for name, scenario in scenarios.items():
+            samples = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = scenario()
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+                samples.append(time.perf_counter() - start)
+            results[name] = summarize(samples)
+        return results
@@ -0,0 +1,146 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import string
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from encyclopedia import links, rendering, titles, util
+
+
+MANIFEST = ".wiki_build.json"
+
+# Directory, under the output root, holding the index pages after the
+# first, which is /wiki/ itself. It sits outside wiki/ so it can never
+# clash with an entry's directory.
+INDEX_PAGES = "index"
+
+
+def index_page_url(number):
+    return reverse("index") if number == 1 else f"/{INDEX_PAGES}/{number}/"
+
+
+def write_index(output):
+    """
+    Writes the index as static pages of WIKI_INDEX_PAGE_SIZE titles in
+    alphabetical order, linked by plain URLs rather than the query strings
+    the dynamic index uses, and returns the number of pages.
+    """
+    pages = []
+    after = None
+    while True:
+        entries, _, has_next = titles.title_page(after=after,
+                                                 limit=settings.WIKI_INDEX_PAGE_SIZE)
+        pages.append(entries)
+        if not has_next:
+            break
+        after = entries[-1]
+
+    # Each letter links to the page holding the first title it starts
+    page_of = {title: number for number, entries in enumerate(pages, 1) for title in entries}
+    letter_links = []
+    for letter in string.ascii_uppercase:
+        first, _, _ = titles.title_page(letter=letter, limit=1)
+        letter_links.append((letter, index_page_url(page_of[first[0]] if first else len(pages))))
+
+    shutil.rmtree(os.path.join(output, INDEX_PAGES), ignore_errors=True)
+    for number, entries in enumerate(pages, 1):
+        directory = (os.path.join(output, "wiki") if number == 1 else
+                     os.path.join(output, INDEX_PAGES, str(number)))
+        write_page(directory, render_to_string("encyclopedia/index.html", {
+            "entries": entries,
+            "letter_links": letter_links,
+            "previous_url": index_page_url(number - 1) if number > 1 else None,
+            "next_url": index_page_url(number + 1) if number < len(pages) else None
+        }))
+    return len(pages)
+
+
+def write_page(directory, html):
+    """
+    Writes index.html and a precompressed index.html.gz into directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    data = html.encode("utf-8")
+    with open(os.path.join(directory, "index.html"), "wb") as f:
+        f.write(data)
+    with open(os.path.join(directory, "index.html.gz"), "wb") as f:
+        f.write(gzip.compress(data, compresslevel=9, mtime=0))
+
+
+class Command(BaseCommand):
+    help = ("Pre-renders every entry into a static site tree, re-rendering only "
+            "entries whose content or backlinks changed since the last build.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="Directory to write the static site into.")
+        parser.add_argument("--force", action="store_true",
+                            help="Re-render every page, e.g. after a template change.")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        output = options["output"]
+        manifest_path = os.path.join(output, MANIFEST)
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            manifest = {}
+        if options["force"]:
+            manifest = {}
+
+        # Pages list their backlinks, so the link graph has to exist first
+        if not links.is_built():
+            links.rebuild()
+
+        entries = util.list_entries()
+        built = {}
+        rendered = 0
+        for title in entries:
+            content = util.get_entry(title)
+            if content is None:
+                continue
+            # The page shows the entry and the pages linking to it, so a
+            # change to either means it has to be rebuilt
+            backlinks = links.backlinks(title)
+            digest = hashlib.sha256("\0".join([content] + backlinks).encode("utf-8")).hexdigest()
+            built[title] = digest
+            if manifest.get(title) == digest:
+                continue
+            html, toc = rendering.render_markdown(content, cached=False)
+            write_page(os.path.join(output, "wiki", title), render_to_string(
+                "encyclopedia/entry.html", {
+                    "title": title,
+                    "entry": html,
+                    "toc": toc,
+                    "backlinks": backlinks
+                }))
+            rendered += 1
+
+        # Remove pages for entries that no longer exist
+        removed = 0
+        for title in set(manifest) - set(built) - {""}:
+            shutil.rmtree(os.path.join(output, "wiki", title), ignore_errors=True)
+            removed += 1
+
+        # The index pages only change when the set of titles or the page
+        # size does
+        index_digest = hashlib.sha256("\n".join(
+            [str(settings.WIKI_INDEX_PAGE_SIZE)] + entries).encode("utf-8")).hexdigest()
+        built[""] = index_digest
+        if manifest.get("") != index_digest:
+            write_index(output)
+
+        with open(manifest_path, "w") as f:
+            json.dump(built, f)
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} of {len(entries)} entries and removed {removed} "
+            f"in {elapsed:.1f}s."))
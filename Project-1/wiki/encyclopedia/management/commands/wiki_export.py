@@ -0,0 +1,48 @@
+import io
+import os
+import tarfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from encyclopedia import util
+
+
+class Command(BaseCommand):
+    help = "Exports every entry as a Markdown file into a directory or tarball."
+
+    def add_arguments(self, parser):
+        parser.add_argument("destination",
+                            help="Directory, or a path ending in .tar, .tar.gz or .tgz.")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        destination = options["destination"]
+        exported = 0
+
+        if destination.endswith((".tar", ".tar.gz", ".tgz")):
+            mode = "w" if destination.endswith(".tar") else "w:gz"
+            with tarfile.open(destination, mode) as tar:
+                for title in util.list_entries():
+                    content = util.get_entry(title)
+                    if content is None:
+                        continue
+                    data = content.encode("utf-8")
+                    info = tarfile.TarInfo(f"{title}.md")
+                    info.size = len(data)
+                    info.mtime = time.time()
+                    tar.addfile(info, io.BytesIO(data))
+                    exported += 1
+        else:
+            os.makedirs(destination, exist_ok=True)
+            for title in util.list_entries():
+                content = util.get_entry(title)
+                if content is None:
+                    continue
+                with open(os.path.join(destination, f"{title}.md"), "wb") as f:
+                    f.write(content.encode("utf-8"))
+                exported += 1
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {exported} entries in {elapsed:.1f}s."))
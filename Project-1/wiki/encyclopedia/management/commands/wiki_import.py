@@ -0,0 +1,114 @@
+import os
+import tarfile
+import time
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand, CommandError
+
+from encyclopedia import titles, util
+
+
+# Number of files saved together, which bounds how much of a large import
+# is held in memory at once. Each batch is flushed to disk and committed to
+# the indexes once.
+BATCH_SIZE = 1000
+
+
+def iter_source(source):
+    """
+    Yields (filename, data) pairs for the Markdown files in a directory or
+    tarball.
+    """
+    if os.path.isdir(source):
+        for dirpath, _, filenames in os.walk(source):
+            for filename in sorted(filenames):
+                if filename.endswith(".md"):
+                    with open(os.path.join(dirpath, filename), "rb") as f:
+                        yield filename, f.read()
+    elif tarfile.is_tarfile(source):
+        with tarfile.open(source, "r:*") as tar:
+            for member in tar:
+                if member.isfile() and member.name.endswith(".md"):
+                    yield os.path.basename(member.name), tar.extractfile(member).read()
+    else:
+        raise CommandError(f"{source} is not a directory or tarball")
+
+
+def prepare(item):
+    """
+    Validates and decodes one file. Returns a (title, content, error)
+    tuple, where error is None for valid entries.
+    """
+    filename, data = item
+    title = filename[:-len(".md")]
+    try:
+        util.validate_title(title)
+    except SuspiciousFileOperation:
+        return title, None, "invalid title"
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError:
+        return title, None, "not valid UTF-8"
+    if not content.strip():
+        return title, None, "empty entry"
+    return title, content, None
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = "Imports Markdown entries from a directory or tarball."
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Directory or tarball of .md files.")
+        parser.add_argument("--overwrite", action="store_true",
+                            help="Replace entries that already exist.")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        # Titles differing only in case or spacing name the same entry, so
+        # entries are matched by their normalized title
+        existing = {}
+        for title in util.list_entries():
+            existing.setdefault(titles.normalize(title), title)
+        imported = skipped = failed = 0
+
+        for batch in batches(iter_source(options["source"]), BATCH_SIZE):
+            accepted = {}
+            for title, content, error in map(prepare, batch):
+                if error:
+                    failed += 1
+                    self.stderr.write(f"{title}: {error}")
+                    continue
+                key = titles.normalize(title)
+                if key in existing or key in accepted:
+                    if not options["overwrite"]:
+                        skipped += 1
+                        continue
+                    # Replace the entry under the title it already has
+                    title = existing.get(key) or accepted[key][0]
+                accepted[key] = (title, content)
+            # Saving updates the title, full-text and link indexes. Pages
+            # are rendered on first view, as for any other save.
+            util.save_entries(accepted.values())
+            for key, (title, _) in accepted.items():
+                existing.setdefault(key, title)
+            imported += len(accepted)
+
+        # Build the in-memory title indexes now rather than on the first search
+        titles.warm()
+
+        elapsed = time.monotonic() - start
+        rate = imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} entries in {elapsed:.1f}s ({rate:.0f}/s), "
+            f"skipped {skipped} existing, {failed} errors."))
@@ -0,0 +1,48 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from encyclopedia.stores import FileSystemStore, SQLiteStore
+
+
+def default_path():
+    """
+    Returns the configured database when SQLiteStore is the entry store,
+    or entries.sqlite3 otherwise.
+    """
+    if issubclass(import_string(settings.WIKI_ENTRY_STORE), SQLiteStore):
+        path = settings.WIKI_ENTRY_STORE_OPTIONS.get("path")
+        if path:
+            return path
+    return os.path.join(settings.BASE_DIR, "entries.sqlite3")
+
+
+class Command(BaseCommand):
+    help = "Copies every entry from the entries/ directory into a SQLite entry store."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=None,
+                            help="SQLite file to write to. Defaults to the path in "
+                                 "WIKI_ENTRY_STORE_OPTIONS when SQLiteStore is "
+                                 "configured, or entries.sqlite3.")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        path = options["path"] or default_path()
+        source = FileSystemStore()
+        target = SQLiteStore(path)
+
+        copied = 0
+        for title in source.list_titles():
+            content = source.read(title)
+            if content is not None:
+                target.write(title, content)
+                copied += 1
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {copied} entries into {path} in {elapsed:.1f}s. Set "
+            f"WIKI_ENTRY_STORE to 'encyclopedia.stores.SQLiteStore' to use it."))
@@ -0,0 +1,77 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from encyclopedia.stores import FileSystemStore, PackStore
+
+
+def default_path():
+    """
+    Returns the configured pack file when PackStore is the entry store, and
+    entries.pack otherwise. Another store's path is never a pack.
+    """
+    if issubclass(import_string(settings.WIKI_ENTRY_STORE), PackStore):
+        path = settings.WIKI_ENTRY_STORE_OPTIONS.get("path")
+        if path:
+            return path
+    return os.path.join(settings.BASE_DIR, "entries.pack")
+
+
+class Command(BaseCommand):
+    help = ("Packs every entry, from .md files and any existing pack, into a "
+            "freshly compacted compressed pack file.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", default=None,
+                            help="Pack file to write. Defaults to the path in "
+                                 "WIKI_ENTRY_STORE_OPTIONS when PackStore is "
+                                 "configured, or entries.pack.")
+        parser.add_argument("--delete", action="store_true",
+                            help="Delete the .md files that were packed and haven't "
+                                 "changed since.")
+
+    def handle(self, *args, **options):
+        start = time.monotonic()
+        path = options["path"] or default_path()
+        store = PackStore(path)
+        file_store = FileSystemStore()
+        before = 0
+        # Stamps of the .md files that were read into the pack, as they were
+        # when read
+        packed_files = {}
+
+        def entries():
+            nonlocal before
+            for title in store.list_titles():
+                stamp = file_store.stamp(title)
+                content = store.read(title)
+                if content is None:
+                    continue
+                if stamp is not None and not store.in_pack(title):
+                    packed_files[title] = stamp
+                before += len(content.encode("utf-8"))
+                yield title, content
+
+        try:
+            count = PackStore.build(path, entries())
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        # Only delete files that haven't been rewritten since they were
+        # packed; anything newer is still the only copy of that version
+        deleted = 0
+        if options["delete"]:
+            for title, stamp in packed_files.items():
+                if file_store.stamp(title) == stamp:
+                    default_storage.delete(f"entries/{title}.md")
+                    deleted += 1
+
+        elapsed = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"Packed {count} entries ({before} bytes of Markdown) into {path} "
+            f"({os.path.getsize(path)} bytes) in {elapsed:.1f}s, deleted {deleted} files. "
+            f"Set WIKI_ENTRY_STORE to 'encyclopedia.stores.PackStore' to use it."))
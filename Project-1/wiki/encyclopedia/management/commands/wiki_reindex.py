@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from encyclopedia import fulltext, links
+
+
+class Command(BaseCommand):
+    help = ("Brings the full-text search index up to date with the entries directory "
+            "and rebuilds the link graph.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true",
+                            help="Drop the index and rebuild it from scratch.")
+
+    def handle(self, *args, **options):
+        count = fulltext.rebuild(full=options["full"])
+        linked = links.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Indexed {count} entries and read links from {linked}."))
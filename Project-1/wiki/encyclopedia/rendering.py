@@ -0,0 +1,347 @@
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+
+import markdown2
+from django.conf import settings
+from django.core.cache import caches
+from django.dispatch import receiver
+from django.utils.text import slugify
+
+from . import util
+from .signals import entry_saved
+
+
+# Rendered pages keyed by title. Each value is a (stamp, html, toc)
+# tuple, where the stamp is the entry's (mtime, size) at render time, so a
+# hit only costs a stat of the file.
+_html_cache = OrderedDict()
+_html_cache_lock = threading.Lock()
+
+# Rendered HTML of individual sections keyed by a hash of their Markdown,
+# so editing one section of a long entry only re-renders that section
+_section_cache = OrderedDict()
+_section_cache_lock = threading.Lock()
+
+_heading_re = re.compile(r"^(#{1,6})[ \t]+(.+?)[ \t#]*$")
+
+# Reference-style link definitions ("[label]: url"), an optional title on
+# the following line, and the bracketed text that may refer to a label
+_definition_re = re.compile(r"^ {0,3}\[([^\]\n]+)\]:[ \t]*\S")
+_definition_title_re = re.compile(r"^[ \t]+[\"'(]")
+_label_re = re.compile(r"\[([^\[\]\n]+)\]")
+
+
+def _cache_size():
+    return getattr(settings, "WIKI_RENDER_CACHE_SIZE", 256)
+
+
+def _section_cache_size():
+    return getattr(settings, "WIKI_SECTION_CACHE_SIZE", 4096)
+
+
+def _cache_backend():
+    """
+    Returns the Django cache named by WIKI_RENDER_CACHE_BACKEND, or None if
+    rendered pages should only be kept in the in-process LRU.
+    """
+    alias = getattr(settings, "WIKI_RENDER_CACHE_BACKEND", None)
+    return caches[alias] if alias else None
+
+
+def _cache_key(title):
+    digest = hashlib.md5(title.encode("utf-8")).hexdigest()
+    return f"wiki:html:{digest}"
+
+
+def _lookup(title, stamp):
+    backend = _cache_backend()
+    if backend is not None:
+        cached = backend.get(_cache_key(title))
+    else:
+        with _html_cache_lock:
+            cached = _html_cache.get(title)
+            if cached is not None:
+                _html_cache.move_to_end(title)
+    if cached is not None and tuple(cached[0]) == stamp:
+        return cached[1], cached[2]
+    return None
+
+
+def _store(title, stamp, html, toc):
+    backend = _cache_backend()
+    if backend is not None:
+        backend.set(_cache_key(title), (stamp, html, toc))
+        return
+    with _html_cache_lock:
+        _html_cache[title] = (stamp, html, toc)
+        _html_cache.move_to_end(title)
+        while len(_html_cache) > _cache_size():
+            _html_cache.popitem(last=False)
+
+
+def invalidate(title):
+    """
+    Drops any cached HTML for the given entry title.
+    """
+    backend = _cache_backend()
+    if backend is not None:
+        backend.delete(_cache_key(title))
+    with _html_cache_lock:
+        _html_cache.pop(title, None)
+
+
+def _walk(lines):
+    """
+    Yields (line, heading, in_fence) for each line of Markdown. heading is a
+    (level, text, slug) tuple when the line is an ATX heading outside fenced
+    code blocks and None otherwise, and in_fence tells whether the line is
+    inside a fenced code block. Slugs are unique within the entry.
+    """
+    in_fence = False
+    seen = set()
+    sections = 0
+    for line in lines:
+        stripped = line.lstrip()
+        if stripped.startswith("```") or stripped.startswith("~~~"):
+            in_fence = not in_fence
+        match = None if in_fence else _heading_re.match(line.rstrip("\r\n"))
+        heading = None
+        if match:
+            # Unsluggable headings are named after their position among
+            # the sections, counting any text before the first heading
+            text = match.group(2)
+            base = slugify(text) or f"section-{sections}"
+            slug, n = base, 1
+            while slug in seen:
+                n += 1
+                slug = f"{base}-{n}"
+            seen.add(slug)
+            heading = (len(match.group(1)), text, slug)
+            sections += 1
+        elif sections == 0:
+            sections = 1
+        yield line, heading, in_fence
+
+
+def _normalize_label(label):
+    return " ".join(label.lower().split())
+
+
+def outline(lines):
+    """
+    Returns a (toc, definitions) pair for Markdown given as lines. The
+    table of contents is a list of (level, heading, slug) tuples for the
+    headings below the page title, and definitions maps each normalised
+    label of a reference-style link definition to its Markdown.
+    """
+    toc = []
+    definitions = {}
+    label = None
+    for line, heading, in_fence in _walk(lines):
+        if heading is not None:
+            if heading[0] > 1:
+                toc.append(heading)
+            label = None
+            continue
+        match = None if in_fence else _definition_re.match(line)
+        if match:
+            label = _normalize_label(match.group(1))
+            definitions[label] = line.rstrip("\r\n")
+        elif label is not None and _definition_title_re.match(line):
+            # A title given on the line after the URL
+            definitions[label] += "\n" + line.rstrip("\r\n")
+            label = None
+        else:
+            label = None
+    return toc, definitions
+
+
+def _with_definitions(markdown, definitions):
+    """
+    Appends to a section the page's link definitions for the labels it
+    uses, so reference-style links resolve as they would if the whole page
+    were rendered at once.
+    """
+    if not definitions:
+        return markdown
+    used = {_normalize_label(label) for label in _label_re.findall(markdown)}
+    needed = [definitions[label] for label in sorted(used & definitions.keys())
+              if definitions[label] not in markdown]
+    if not needed:
+        return markdown
+    return markdown.rstrip("\n") + "\n\n" + "\n".join(needed) + "\n"
+
+
+def split_sections(content):
+    """
+    Splits Markdown at its ATX headings (outside fenced code blocks) and
+    returns a list of (level, heading, slug, markdown) sections. Text
+    before the first heading becomes a section with level 0 and no heading.
+    Slugs are unique within the entry.
+    """
+    sections = []
+    level, heading, slug, lines = 0, None, "", []
+    for line, match, _ in _walk(content.splitlines(keepends=True)):
+        if match:
+            if lines:
+                sections.append((level, heading, slug, "".join(lines)))
+            (level, heading, slug), lines = match, []
+        lines.append(line)
+    if lines or not sections:
+        sections.append((level, heading, slug, "".join(lines)))
+    return sections
+
+
+def render_section(markdown, cached=True):
+    """
+    Returns one section of Markdown rendered to HTML, reusing the HTML of
+    an identical section rendered earlier.
+    """
+    if not cached:
+        return markdown2.markdown(markdown)
+    key = hashlib.sha1(markdown.encode("utf-8")).digest()
+    with _section_cache_lock:
+        html = _section_cache.get(key)
+        if html is not None:
+            _section_cache.move_to_end(key)
+            return html
+    html = markdown2.markdown(markdown)
+    with _section_cache_lock:
+        _section_cache[key] = html
+        while len(_section_cache) > _section_cache_size():
+            _section_cache.popitem(last=False)
+    return html
+
+
+def render_markdown(content, cached=True):
+    """
+    Returns an (html, toc) pair for an entry's Markdown. Each section is
+    rendered on its own, together with the page's link definitions it
+    refers to, and wrapped in an element whose id is the section's slug.
+    The table of contents is a list of (level, heading, slug) tuples for
+    the headings below the page title.
+    """
+    toc, definitions = outline(content.splitlines(keepends=True))
+    parts = []
+    for level, heading, slug, markdown in split_sections(content):
+        html = render_section(_with_definitions(markdown, definitions), cached)
+        if slug:
+            parts.append(f'<div class="entry-section" id="{slug}">{html}</div>')
+        else:
+            parts.append(html)
+    return "".join(parts), toc
+
+
+def render_page(title, stamp=None):
+    """
+    Returns an (html, toc) pair for an entry, reusing the cached page while
+    the entry is unchanged. stamp is the entry's current stamp if the caller
+    already has it. If no such entry exists, returns None.
+    """
+    if stamp is None:
+        stamp = util.entry_stamp(title)
+    if stamp is None:
+        return None
+    page = _lookup(title, stamp)
+    if page is None:
+        content = util.get_entry(title)
+        if content is None:
+            return None
+        page = render_markdown(content)
+        _store(title, stamp, *page)
+    return page
+
+
+def render_entry(title):
+    """
+    Returns the entry rendered to HTML, reusing the cached copy while the
+    file is unchanged. If no such entry exists, the function returns None.
+    """
+    page = render_page(title)
+    return page[0] if page else None
+
+
+def render_entry_section(title, slug):
+    """
+    Returns the HTML of the entry section with the given slug, or None if
+    the entry or section doesn't exist.
+    """
+    content = util.get_entry(title)
+    if content is None:
+        return None
+    for _, _, section_slug, markdown in split_sections(content):
+        if section_slug and section_slug == slug:
+            _, definitions = outline(content.splitlines(keepends=True))
+            return render_section(_with_definitions(markdown, definitions))
+    return None
+
+
+def _entry_lines(title):
+    with util.open_entry(title) as f:
+        for raw_line in f:
+            yield raw_line.decode("utf-8")
+
+
+def outline_entry(title):
+    """
+    Returns the (toc, definitions) outline of an entry, reading it line by
+    line rather than loading it whole.
+    """
+    return outline(_entry_lines(title))
+
+
+def streaming_threshold():
+    """
+    Returns the entry size in bytes above which pages are streamed.
+    """
+    return getattr(settings, "WIKI_STREAMING_THRESHOLD", 1024 * 1024)
+
+
+def iter_entry_html(title, definitions=None, chunk_size=64 * 1024):
+    """
+    Yields an entry rendered to HTML in pieces, reading and rendering
+    roughly chunk_size bytes of Markdown at a time. Each section is wrapped
+    in the same element as in render_markdown, and long sections are split
+    at blank lines outside fenced code blocks so that each piece is a run
+    of complete Markdown blocks. definitions are the page's link
+    definitions from outline_entry, read first if not given.
+    """
+    if definitions is None:
+        _, definitions = outline_entry(title)
+
+    def render(lines):
+        # markdown2 turns a piece holding nothing but link definitions into
+        # an empty paragraph, which the page rendered whole wouldn't have
+        if all(not line.strip() or _definition_re.match(line) or
+               _definition_title_re.match(line) for line in lines):
+            return ""
+        return markdown2.markdown(_with_definitions("".join(lines), definitions))
+
+    lines = []
+    size = 0
+    in_section = False
+    for line, heading, in_fence in _walk(_entry_lines(title)):
+        if heading is not None:
+            if lines:
+                yield render(lines)
+                lines, size = [], 0
+            if in_section:
+                yield "</div>"
+            yield f'<div class="entry-section" id="{heading[2]}">'
+            in_section = True
+        lines.append(line)
+        size += len(line)
+        if size >= chunk_size and not in_fence and not line.strip():
+            yield render(lines)
+            lines, size = [], 0
+    if lines:
+        yield render(lines)
+    if in_section:
+        yield "</div>"
+
+
+@receiver(entry_saved)
+def _entry_saved(sender, title, **kwargs):
+    invalidate(title)
@@ -0,0 +1,200 @@
+import difflib
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+# Each revision log is a sequence of records, each a header holding the
+# record kind and payload length followed by a zlib-compressed JSON payload.
+# Keyframes hold the full text; deltas hold line operations against the
+# previous revision, so history costs roughly the size of the edits.
+_header = struct.Struct(">BI")
+KEYFRAME = 0
+DELTA = 1
+
+# In-process locks for each title, on top of the lock file that serialises
+# saves across processes
+_thread_locks = [threading.Lock() for _ in range(64)]
+
+
+def _keyframe_interval():
+    return getattr(settings, "WIKI_REVISION_KEYFRAME_INTERVAL", 20)
+
+
+def _revision_limit():
+    return getattr(settings, "WIKI_REVISION_LIMIT", 100)
+
+
+def _filename(title):
+    """
+    Returns the name used for a title's files under revisions/. Hashing the
+    title keeps any character it contains out of the path.
+    """
+    return hashlib.sha1(title.encode("utf-8")).hexdigest()
+
+
+def _log_path(title):
+    return default_storage.path(f"revisions/{_filename(title)}.log")
+
+
+@contextmanager
+def locked(title):
+    """
+    Holds an exclusive lock on the given title for the duration of the
+    block, both within this process and across processes sharing the
+    revisions directory.
+    """
+    os.makedirs(default_storage.path("revisions"), exist_ok=True)
+    with _thread_locks[hash(title) % len(_thread_locks)]:
+        with open(default_storage.path(f"revisions/{_filename(title)}.lock"), "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_records(title):
+    """
+    Returns the list of (kind, payload) records in a title's revision log.
+    """
+    try:
+        with open(_log_path(title), "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    records = []
+    offset = 0
+    while offset + _header.size <= len(data):
+        kind, length = _header.unpack_from(data, offset)
+        offset += _header.size
+        records.append((kind, data[offset:offset + length]))
+        offset += length
+    return records
+
+
+def _decode(payload):
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+def _encode(kind, record):
+    payload = zlib.compress(json.dumps(record, separators=(",", ":")).encode("utf-8"))
+    return _header.pack(kind, len(payload)) + payload
+
+
+def _delta(old, new):
+    """
+    Returns the line operations that turn old into new. Each operation is
+    either a [start, end] range of old lines to copy or a string to insert.
+    """
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(new_lines[j1:j2]))
+    return ops
+
+
+def _apply(old, ops):
+    old_lines = old.splitlines(keepends=True)
+    return "".join("".join(old_lines[op[0]:op[1]]) if isinstance(op, list) else op
+                   for op in ops)
+
+
+def _replay(records):
+    """
+    Returns the list of (timestamp, content) revisions encoded by records.
+    """
+    revisions = []
+    content = ""
+    for kind, payload in records:
+        record = _decode(payload)
+        if kind == KEYFRAME:
+            content = record["text"]
+        else:
+            content = _apply(content, record["ops"])
+        revisions.append((record["time"], content))
+    return revisions
+
+
+def history(title):
+    """
+    Returns the saved revisions of an entry as a list of (timestamp,
+    content) pairs, oldest first.
+    """
+    return _replay(_read_records(title))
+
+
+def record(title, content):
+    """
+    Appends a new revision of an entry to its log, compacting the log once
+    it holds too many revisions. Callers must hold locked(title).
+    """
+    records = _read_records(title)
+    now = time.time()
+    since_keyframe = 0
+    for kind, _ in reversed(records):
+        if kind == KEYFRAME:
+            break
+        since_keyframe += 1
+
+    if not records or since_keyframe + 1 >= _keyframe_interval():
+        data = _encode(KEYFRAME, {"time": now, "text": content})
+    else:
+        # Only the records since the last keyframe are needed to rebuild
+        # the previous revision
+        tail = records[len(records) - since_keyframe - 1:]
+        previous = _replay(tail)[-1][1]
+        if previous == content:
+            return
+        data = _encode(DELTA, {"time": now, "ops": _delta(previous, content)})
+
+    limit = _revision_limit()
+    if len(records) + 1 > limit + _keyframe_interval():
+        # Keep the newest limit - 1 revisions before this one; with a limit
+        # of 1, only this one
+        revisions = _replay(records)
+        kept = revisions[len(revisions) - (limit - 1):] if limit > 1 else []
+        _compact(title, kept + [(now, content)])
+    else:
+        with open(_log_path(title), "ab") as f:
+            f.write(data)
+
+
+def _compact(title, revisions):
+    """
+    Rewrites a title's log so it holds only the given revisions.
+    """
+    chunks = []
+    previous = None
+    for i, (timestamp, content) in enumerate(revisions):
+        if previous is None or i % _keyframe_interval() == 0:
+            chunks.append(_encode(KEYFRAME, {"time": timestamp, "text": content}))
+        else:
+            chunks.append(_encode(DELTA, {"time": timestamp,
+                                          "ops": _delta(previous, content)}))
+        previous = content
+    path = _log_path(title)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"".join(chunks))
+    os.replace(tmp_path, path)
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent by util.save_entry after an entry has been written, with the
+# keyword arguments title and content.
+entry_saved = Signal()
@@ -0,0 +1,38 @@
+// Loads the next page of titles as JSON when the user scrolls near the
+// bottom of the list, so the index can be read as one continuous page.
+document.addEventListener('DOMContentLoaded', () => {
+    const list = document.querySelector('#entries');
+    let next = list.dataset.next;
+    let loading = false;
+
+    if (next) {
+        const link = document.querySelector('#next-page');
+        if (link) {
+            link.style.display = 'none';
+        }
+    }
+
+    window.addEventListener('scroll', () => {
+        if (!next || loading) {
+            return;
+        }
+        if (window.innerHeight + window.scrollY < document.body.offsetHeight - 200) {
+            return;
+        }
+        loading = true;
+        fetch(next)
+        .then(response => response.json())
+        .then(page => {
+            page.entries.forEach(title => {
+                const item = document.createElement('li');
+                const link = document.createElement('a');
+                link.href = `/wiki/${encodeURIComponent(title)}/`;
+                link.textContent = title;
+                item.append(link);
+                list.append(item);
+            });
+            next = page.next;
+            loading = false;
+        });
+    });
+});
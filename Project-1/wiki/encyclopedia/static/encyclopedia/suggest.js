@@ -0,0 +1,29 @@
+// Fills the search box's datalist with matching titles as the user types
+document.addEventListener('DOMContentLoaded', () => {
+    const input = document.querySelector('.search');
+    const datalist = document.querySelector('#search-suggestions');
+    let latest = '';
+
+    input.addEventListener('input', () => {
+        const query = input.value.trim();
+        latest = query;
+        if (!query) {
+            datalist.innerHTML = '';
+            return;
+        }
+        fetch(`${input.dataset.suggestUrl}?q=${encodeURIComponent(query)}`)
+        .then(response => response.json())
+        .then(data => {
+            // Ignore responses that arrive after a newer query was typed
+            if (query !== latest) {
+                return;
+            }
+            datalist.innerHTML = '';
+            data.suggestions.forEach(title => {
+                const option = document.createElement('option');
+                option.value = title;
+                datalist.append(option);
+            });
+        });
+    });
+});
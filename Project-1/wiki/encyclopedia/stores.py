@@ -0,0 +1,412 @@
+import io
+import mmap
+import os
+import re
+import sqlite3
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class FileSystemStore:
+    """
+    Keeps each entry as a Markdown file under entries/ in default_storage.
+    """
+
+    # Full-text search is answered by the separate inverted index
+    supports_search = False
+
+    def version(self):
+        """
+        Returns a nanosecond timestamp that changes whenever an entry is
+        added, removed or replaced.
+        """
+        return os.stat(default_storage.path("entries")).st_mtime_ns
+
+    def list_titles(self):
+        """
+        Returns the sorted list of entry titles.
+        """
+        _, filenames = default_storage.listdir("entries")
+        return sorted(re.sub(r"\.md$", "", filename)
+                      for filename in filenames if filename.endswith(".md"))
+
+    def stamp(self, title):
+        """
+        Returns a (mtime, size) pair identifying the current version of an
+        entry, or None if it doesn't exist.
+        """
+        try:
+            st = os.stat(default_storage.path(f"entries/{title}.md"))
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def read(self, title):
+        """
+        Returns the Markdown content of an entry, or None if it doesn't exist.
+        """
+        try:
+            with default_storage.open(f"entries/{title}.md") as f:
+                return f.read().decode("utf-8")
+        except FileNotFoundError:
+            return None
+
+    def open(self, title):
+        """
+        Returns a binary file object for reading an entry line by line.
+        """
+        return default_storage.open(f"entries/{title}.md")
+
+    def write(self, title, content, sync=True):
+        """
+        Writes an entry to a temporary file next to its destination and
+        renames it into place, so readers only ever see the old or the new
+        file. With sync=False the file isn't flushed to disk; the caller
+        is expected to call sync() once it has written a batch.
+        """
+        path = default_storage.path(f"entries/{title}.md")
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                        prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content.encode("utf-8"))
+                if sync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.chmod(tmp_path, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def sync(self):
+        """
+        Flushes entries written with sync=False to disk.
+        """
+        if hasattr(os, "sync"):
+            os.sync()
+
+
+class PackStore(FileSystemStore):
+    """
+    Keeps entries zlib-compressed in a single append-only pack file, read
+    through a memory map. Each record is a header (title length, compressed
+    length, uncompressed length, mtime in nanoseconds), the UTF-8 title and
+    the compressed content; the last record for a title wins. Entries that
+    are still plain .md files under entries/ remain readable, and are
+    removed once the entry is saved into the pack.
+    """
+
+    HEADER = struct.Struct(">HIIq")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._index = {}
+        self._scanned = 0
+        self._inode = None
+        self._map = None
+
+    def _refresh(self):
+        """
+        Brings the in-memory offset index up to date with the pack file,
+        reading only the headers of records appended since the last call.
+        Returns the current memory map, or None if the pack is empty.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            st = None
+        with self._lock:
+            if st is None or st.st_ino != self._inode or st.st_size < self._scanned:
+                # The pack was created, replaced or truncated: start over
+                self._index = {}
+                self._scanned = 0
+                self._inode = st.st_ino if st else None
+                self._map = None
+            if st is None or st.st_size == 0:
+                return None
+            if self._map is None or len(self._map) != st.st_size:
+                with open(self.path, "rb") as f:
+                    self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self._map
+            offset = self._scanned
+            while offset + self.HEADER.size <= len(data):
+                title_length, length, size, mtime = self.HEADER.unpack_from(data, offset)
+                start = offset + self.HEADER.size
+                end = start + title_length + length
+                if end > len(data):
+                    # A record still being appended by another process
+                    break
+                title = data[start:start + title_length].decode("utf-8")
+                self._index[title] = (start + title_length, length, size, mtime)
+                offset = end
+            self._scanned = offset
+            return data
+
+    def _record(self, title):
+        data = self._refresh()
+        record = self._index.get(title)
+        return (data, record) if record else (None, None)
+
+    def _record_count(self):
+        self._refresh()
+        return len(self._index)
+
+    def in_pack(self, title):
+        """
+        Returns whether the pack holds a record for the title, as opposed to
+        the entry only existing as a .md file.
+        """
+        return self._record(title)[1] is not None
+
+    def version(self):
+        try:
+            pack_mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            pack_mtime = 0
+        return max(pack_mtime, super().version())
+
+    def list_titles(self):
+        self._refresh()
+        return sorted(set(self._index) | set(super().list_titles()))
+
+    def stamp(self, title):
+        _, record = self._record(title)
+        if record:
+            _, _, size, mtime = record
+            return (mtime, size)
+        return super().stamp(title)
+
+    def read(self, title):
+        data, record = self._record(title)
+        if record:
+            offset, length, _, _ = record
+            return zlib.decompress(data[offset:offset + length]).decode("utf-8")
+        return super().read(title)
+
+    def open(self, title):
+        data, record = self._record(title)
+        if record:
+            offset, length, _, _ = record
+            return io.BytesIO(zlib.decompress(data[offset:offset + length]))
+        return super().open(title)
+
+    def write(self, title, content, sync=True):
+        raw = content.encode("utf-8")
+        encoded_title = title.encode("utf-8")
+        payload = zlib.compress(raw)
+        record = self.HEADER.pack(len(encoded_title), len(payload), len(raw),
+                                  time.time_ns()) + encoded_title + payload
+        with self._locked_pack(self.path) as f:
+            f.write(record)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+        # The pack now holds the newest version, so drop any plain file
+        try:
+            default_storage.delete(f"entries/{title}.md")
+        except FileNotFoundError:
+            pass
+
+    def sync(self):
+        with self._locked_pack(self.path) as f:
+            os.fsync(f.fileno())
+
+    def entries(self):
+        """
+        Yields (title, content) for the newest version of every entry.
+        """
+        for title in self.list_titles():
+            content = self.read(title)
+            if content is not None:
+                yield title, content
+
+    @staticmethod
+    @contextmanager
+    def _locked_pack(path):
+        """
+        Opens the pack at path for appending and holds an exclusive lock on
+        it for the duration of the block. If build() replaced the file while
+        this was waiting for the lock, the new file is opened and locked
+        instead, so nothing is appended to a pack that is no longer in use.
+        """
+        while True:
+            with open(path, "ab") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    current = os.stat(path).st_ino == os.fstat(f.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+                if current:
+                    try:
+                        yield f
+                    finally:
+                        if fcntl is not None:
+                            fcntl.flock(f, fcntl.LOCK_UN)
+                    return
+
+    @classmethod
+    def build(cls, path, entries):
+        """
+        Writes a new pack holding the given (title, content) pairs to a
+        temporary file and renames it over path. The pack's lock is held
+        throughout, so saves made meanwhile by running servers wait and are
+        then appended to the new pack. entries may read from the pack being
+        replaced. Returns the number of entries written. Raises ValueError
+        rather than replace a non-empty file at path that isn't a pack.
+        """
+        with cls._locked_pack(path) as f:
+            if os.fstat(f.fileno()).st_size and not cls(path)._record_count():
+                raise ValueError(f"{path} is not empty and holds no pack records")
+            return cls._build(path, entries)
+
+    @classmethod
+    def _build(cls, path, entries):
+        count = 0
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)),
+                                        prefix=".pack.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for title, content in entries:
+                    raw = content.encode("utf-8")
+                    encoded_title = title.encode("utf-8")
+                    payload = zlib.compress(raw, 9)
+                    f.write(cls.HEADER.pack(len(encoded_title), len(payload), len(raw),
+                                            time.time_ns()))
+                    f.write(encoded_title)
+                    f.write(payload)
+                    count += 1
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return count
+
+
+class SQLiteStore:
+    """
+    Keeps entries in a SQLite database with an FTS5 index over titles and
+    content, giving transactional saves, indexed listing and ranked
+    full-text search.
+    """
+
+    supports_search = True
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY,
+        title TEXT NOT NULL UNIQUE,
+        content TEXT NOT NULL,
+        mtime INTEGER NOT NULL,
+        size INTEGER NOT NULL
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+        title, content, content='entries', content_rowid='id'
+    );
+    CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+    END;
+    CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+        INSERT INTO entries_fts (entries_fts, rowid, title, content)
+        VALUES ('delete', old.id, old.title, old.content);
+        INSERT INTO entries_fts (rowid, title, content)
+        VALUES (new.id, new.title, new.content);
+    END;
+    CREATE TABLE IF NOT EXISTS store_meta (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        version INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO store_meta VALUES (0, 0);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def version(self):
+        return self._connect().execute(
+            "SELECT version FROM store_meta").fetchone()[0]
+
+    def list_titles(self):
+        return [title for title, in self._connect().execute(
+            "SELECT title FROM entries ORDER BY title")]
+
+    def stamp(self, title):
+        row = self._connect().execute(
+            "SELECT mtime, size FROM entries WHERE title = ?", (title,)).fetchone()
+        return tuple(row) if row else None
+
+    def read(self, title):
+        row = self._connect().execute(
+            "SELECT content FROM entries WHERE title = ?", (title,)).fetchone()
+        return row[0] if row else None
+
+    def open(self, title):
+        content = self.read(title)
+        if content is None:
+            raise FileNotFoundError(title)
+        return io.BytesIO(content.encode("utf-8"))
+
+    def write(self, title, content, sync=True):
+        # Each write commits on its own, so there is nothing for sync() to
+        # flush afterwards
+        now = time.time_ns()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO entries (title, content, mtime, size) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (title) DO UPDATE SET content = excluded.content, "
+                "mtime = excluded.mtime, size = excluded.size",
+                (title, content, now, len(content.encode("utf-8"))))
+            conn.execute("UPDATE store_meta SET version = max(version + 1, ?)", (now,))
+
+    def sync(self):
+        pass
+
+    def search(self, query, limit=20):
+        """
+        Returns up to limit (title, score) pairs for the entries matching
+        any of the words in query, best match first.
+        """
+        words = re.findall(r"\w+", query)
+        if not words:
+            return []
+        # Quote every word so user input is never read as FTS5 syntax
+        match = " OR ".join('"{}"'.format(word) for word in words)
+        return [(title, -rank) for title, rank in self._connect().execute(
+            "SELECT entries.title, entries_fts.rank FROM entries_fts "
+            "JOIN entries ON entries.id = entries_fts.rowid "
+            "WHERE entries_fts MATCH ? ORDER BY entries_fts.rank LIMIT ?",
+            (match, limit))]
@@ -1,3 +1,775 @@
-from django.test import TestCase
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import zlib
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+import markdown2
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+
+from . import fulltext, indexdb, links, rendering, revisions, titles, util
+from .stores import FileSystemStore, PackStore, SQLiteStore
+
+
+class WikiTestCase(SimpleTestCase):
+    """
+    Runs each test against empty entries and index directories of its own.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        os.makedirs(os.path.join(self.directory, "entries"))
+        settings = override_settings(
+            MEDIA_ROOT=self.directory,
+            WIKI_INDEX_DB=os.path.join(self.directory, "index.sqlite3"),
+            WIKI_RENDER_CACHE_BACKEND=None,
+            WIKI_ENTRY_STORE="encyclopedia.stores.FileSystemStore",
+            WIKI_ENTRY_STORE_OPTIONS={})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        with rendering._html_cache_lock:
+            rendering._html_cache.clear()
+        with rendering._section_cache_lock:
+            rendering._section_cache.clear()
+
+    def write_file(self, title, content):
+        with open(os.path.join(self.directory, "entries", f"{title}.md"), "w") as f:
+            f.write(content)
+
+
+class CountingStruct(struct.Struct):
+
+    unpacked = 0
+
+    def unpack_from(self, *args, **kwargs):
+        self.unpacked += 1
+        return super().unpack_from(*args, **kwargs)
+
+
+class PackStoreTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.directory, "entries.pack")
+        self.store = PackStore(self.path)
+
+    def test_record_format(self):
+        self.store.write("Cat", "# Cat\nMeow")
+        with open(self.path, "rb") as f:
+            data = f.read()
+        title_length, length, size, mtime = PackStore.HEADER.unpack_from(data, 0)
+        start = PackStore.HEADER.size
+        self.assertEqual(data[start:start + title_length], b"Cat")
+        payload = data[start + title_length:start + title_length + length]
+        self.assertEqual(zlib.decompress(payload), b"# Cat\nMeow")
+        self.assertEqual(size, len(b"# Cat\nMeow"))
+        self.assertEqual(len(data), start + title_length + length)
+        self.assertEqual(self.store.stamp("Cat"), (mtime, size))
+
+    def test_last_record_wins(self):
+        self.store.write("Cat", "old")
+        self.store.write("Cat", "new")
+        self.assertEqual(self.store.read("Cat"), "new")
+        self.assertEqual(self.store.list_titles(), ["Cat"])
+
+    def test_refresh_reads_only_appended_records(self):
+        self.store.write("Cat", "Meow")
+        self.store.read("Cat")
+        scanned = self.store._scanned
+
+        # Another process appends a record, the last part of it still unwritten
+        other = PackStore(self.path)
+        other.write("Dog", "Woof")
+        with open(self.path, "rb") as f:
+            record = f.read()[scanned:]
+        with open(self.path, "ab") as f:
+            f.write(record[:-2])
+        header = CountingStruct(PackStore.HEADER.format)
+        with mock.patch.object(PackStore, "HEADER", header):
+            self.assertEqual(self.store.read("Dog"), "Woof")
+        # Only the new header and the incomplete one after it were read
+        self.assertEqual(header.unpacked, 2)
+        self.assertEqual(self.store._scanned, scanned + len(record))
+
+        with open(self.path, "ab") as f:
+            f.write(record[-2:])
+        self.assertEqual(self.store.list_titles(), ["Cat", "Dog"])
+
+    def test_plain_files_remain_readable(self):
+        self.write_file("Cat", "Meow")
+        self.assertEqual(self.store.read("Cat"), "Meow")
+        self.store.write("Cat", "Purr")
+        self.assertEqual(self.store.read("Cat"), "Purr")
+        self.assertFalse(os.path.exists(os.path.join(self.directory, "entries", "Cat.md")))
+
+    def test_build_keeps_saves_made_while_building(self):
+        self.store.write("Cat", "Meow")
+        writer = threading.Thread(target=PackStore(self.path).write, args=("Dog", "Woof"))
+
+        def entries():
+            yield "Cat", self.store.read("Cat")
+            # Save while the old pack is still in place
+            writer.start()
+            time.sleep(0.2)
+
+        PackStore.build(self.path, entries())
+        writer.join()
+        self.assertEqual(PackStore(self.path).read("Dog"), "Woof")
+        self.assertEqual(self.store.read("Cat"), "Meow")
+
+    def test_pack_command_keeps_files_changed_while_packing(self):
+        self.write_file("Cat", "Meow")
+        self.write_file("Dog", "Woof")
+        build = PackStore.build
+
+        def build_then_edit(path, entries):
+            count = build(path, entries)
+            self.write_file("Dog", "Woof woof")
+            return count
+
+        with mock.patch.object(PackStore, "build", side_effect=build_then_edit):
+            call_command("wiki_pack", "--path", self.path, "--delete", stdout=StringIO())
+        self.assertEqual(FileSystemStore().list_titles(), ["Dog"])
+        self.assertEqual(self.store.read("Cat"), "Meow")
+        self.assertEqual(self.store.read("Dog"), "Woof")
+
+    def test_pack_command_ignores_other_stores_path(self):
+        database = os.path.join(self.directory, "entries.sqlite3")
+        with override_settings(BASE_DIR=self.directory,
+                               WIKI_ENTRY_STORE="encyclopedia.stores.SQLiteStore",
+                               WIKI_ENTRY_STORE_OPTIONS={"path": database}):
+            util.save_entry("Cat", "# Cat")
+            call_command("wiki_pack", stdout=StringIO())
+            self.assertEqual(util.get_entry("Cat"), "# Cat")
+        self.assertEqual(SQLiteStore(database).read("Cat"), "# Cat")
+        self.assertTrue(os.path.exists(self.path))
+
+    def test_build_refuses_to_replace_other_files(self):
+        with open(self.path, "wb") as f:
+            f.write(b"SQLite format 3\0" + bytes(100))
+        with self.assertRaises(CommandError):
+            call_command("wiki_pack", "--path", self.path, stdout=StringIO())
+        with open(self.path, "rb") as f:
+            self.assertTrue(f.read().startswith(b"SQLite format 3"))
+
+
+class SQLiteStoreTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(self.directory, "entries.sqlite3")
+        settings = override_settings(WIKI_ENTRY_STORE="encyclopedia.stores.SQLiteStore",
+                                     WIKI_ENTRY_STORE_OPTIONS={"path": self.path})
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_save_and_read(self):
+        store = util.get_store()
+        self.assertIsInstance(store, SQLiteStore)
+        self.assertIsNone(util.get_entry("Cat"))
+        self.assertIsNone(store.stamp("Cat"))
+        version = store.version()
+        util.save_entry("Cat", "# Cat\nMeow")
+        self.assertEqual(util.get_entry("Cat"), "# Cat\nMeow")
+        self.assertEqual(store.stamp("Cat")[1], len(b"# Cat\nMeow"))
+        self.assertGreater(store.version(), version)
+
+        version = store.version()
+        util.save_entry("Cat", "# Cat\nPurr")
+        self.assertEqual(util.get_entry("Cat"), "# Cat\nPurr")
+        self.assertGreater(store.version(), version)
+        self.assertEqual(SQLiteStore(self.path).read("Cat"), "# Cat\nPurr")
+
+    def test_list_titles(self):
+        for title in ["Python", "CSS", "Django"]:
+            util.save_entry(title, f"# {title}")
+        self.assertEqual(util.get_store().list_titles(), ["CSS", "Django", "Python"])
+        self.assertEqual(util.list_entries(), ["CSS", "Django", "Python"])
+
+    def test_search_treats_query_as_words(self):
+        util.save_entry("Cat", "# Cat\nCats purr and nap.")
+        util.save_entry("Dog", "# Dog\nDogs bark.")
+        store = util.get_store()
+        self.assertEqual([title for title, _ in store.search("purr")], ["Cat"])
+        self.assertEqual(sorted(title for title, _ in store.search("bark nap")), ["Cat", "Dog"])
+        for query in ['purr" OR "bark', "NOT purr", "purr*", "title:Cat", "NEAR(purr nap)",
+                      '"', "(", "-"]:
+            store.search(query)
+        self.assertEqual([title for title, _ in store.search('"purr"')], ["Cat"])
+        self.assertEqual(store.search('" * ( )'), [])
+
+    def test_views(self):
+        util.save_entry("Cat", "# Cat\nCats purr.")
+        response = self.client.get(reverse("entry", args=["Cat"]))
+        self.assertContains(response, "Cats purr.")
+        response = self.client.get(reverse("entry", args=["cat"]))
+        self.assertRedirects(response, reverse("entry", args=["Cat"]))
+        response = self.client.get(reverse("search"), {"q": "purr"})
+        self.assertEqual([title for title, _ in response.context["matches"]], ["Cat"])
+
+    def test_migrate_store(self):
+        self.write_file("Cat", "# Cat\nMeow")
+        self.write_file("Dog", "# Dog\nWoof")
+        with override_settings(BASE_DIR=self.directory):
+            call_command("wiki_migrate_store", stdout=StringIO())
+        store = util.get_store()
+        self.assertEqual(store.list_titles(), ["Cat", "Dog"])
+        self.assertEqual(store.read("Dog"), "# Dog\nWoof")
+        self.assertEqual([title for title, _ in store.search("meow")], ["Cat"])
+
+    def test_migrate_store_ignores_other_stores_path(self):
+        self.write_file("Cat", "# Cat")
+        pack = os.path.join(self.directory, "entries.pack")
+        with override_settings(BASE_DIR=self.directory,
+                               WIKI_ENTRY_STORE="encyclopedia.stores.PackStore",
+                               WIKI_ENTRY_STORE_OPTIONS={"path": pack}):
+            call_command("wiki_migrate_store", stdout=StringIO())
+        self.assertFalse(os.path.exists(pack))
+        self.assertEqual(SQLiteStore(self.path).list_titles(), ["Cat"])
+
+
+class RevisionTests(WikiTestCase):
+
+    def kinds(self, title):
+        return [kind for kind, _ in revisions._read_records(title)]
+
+    def test_delta_round_trip(self):
+        pairs = [
+            ("", "one\ntwo\n"),
+            ("one\ntwo\nthree\n", "one\n2\nthree\nfour"),
+            ("a\nb\nc\n", "c\nb\na\n"),
+            ("same\n", "same\n"),
+            ("text without newline", ""),
+        ]
+        for old, new in pairs:
+            with self.subTest(old=old, new=new):
+                self.assertEqual(revisions._apply(old, revisions._delta(old, new)), new)
+
+    def test_history(self):
+        util.save_entry("Cat", "# Cat\nMeow\n")
+        util.save_entry("Cat", "# Cat\nMeow\nPurr\n")
+        # Saving the same text again doesn't add a revision
+        util.save_entry("Cat", "# Cat\nMeow\nPurr\n")
+        util.save_entry("Cat", "# Cat\nPurr\n")
+        self.assertEqual([content for _, content in revisions.history("Cat")],
+                         ["# Cat\nMeow\n", "# Cat\nMeow\nPurr\n", "# Cat\nPurr\n"])
+        self.assertEqual(revisions.history("Dog"), [])
+
+    @override_settings(WIKI_REVISION_KEYFRAME_INTERVAL=3)
+    def test_keyframe_interval(self):
+        for i in range(7):
+            util.save_entry("Cat", f"# Cat\n{i}\n")
+        K, D = revisions.KEYFRAME, revisions.DELTA
+        self.assertEqual(self.kinds("Cat"), [K, D, D, K, D, D, K])
+        self.assertEqual(revisions.history("Cat")[-1][1], "# Cat\n6\n")
+
+    @override_settings(WIKI_REVISION_KEYFRAME_INTERVAL=2, WIKI_REVISION_LIMIT=4)
+    def test_compaction(self):
+        contents = [f"# Cat\n{i}\n" for i in range(12)]
+        for content in contents:
+            util.save_entry("Cat", content)
+            self.assertLessEqual(len(revisions.history("Cat")), 4 + 2)
+        history = [content for _, content in revisions.history("Cat")]
+        self.assertEqual(history, contents[-len(history):])
+        self.assertEqual(self.kinds("Cat")[0], revisions.KEYFRAME)
+
+    @override_settings(WIKI_REVISION_KEYFRAME_INTERVAL=2, WIKI_REVISION_LIMIT=1)
+    def test_compaction_with_a_limit_of_one(self):
+        for i in range(8):
+            util.save_entry("Cat", f"# Cat\n{i}\n")
+            self.assertLessEqual(len(revisions.history("Cat")), 1 + 2)
+        self.assertEqual(revisions.history("Cat")[-1][1], "# Cat\n7\n")
+
+    def test_titles_cannot_leave_the_entries_directory(self):
+        for title in ["../escaped", "a/b", "a\\b", ".hidden", ".."]:
+            with self.subTest(title=title):
+                with self.assertRaises(SuspiciousFileOperation):
+                    util.save_entry(title, "text")
+        self.assertEqual(os.listdir(self.directory), ["entries"])
+
+        util.save_entry("C++ & Go?", "text")
+        names = os.listdir(os.path.join(self.directory, "revisions"))
+        self.assertTrue(all(name.split(".")[0].isalnum() for name in names))
+
+
+class TitleIndexTests(WikiTestCase):
+
+    def test_saved_titles_are_inserted_in_order(self):
+        util.save_entry("Dog", "# Dog")
+        util.save_entry("Cat", "# Cat")
+        self.assertEqual(util.list_entries(), ["Cat", "Dog"])
+        with mock.patch.object(FileSystemStore, "list_titles") as list_titles:
+            util.save_entry("Bird", "# Bird")
+            self.assertEqual(util.list_entries(), ["Bird", "Cat", "Dog"])
+        # The app's own saves don't cause a rescan of the directory
+        list_titles.assert_not_called()
+
+    def test_files_added_outside_the_app_are_picked_up(self):
+        util.save_entry("Cat", "# Cat")
+        self.assertEqual(util.list_entries(), ["Cat"])
+        generation, _ = util.title_index()
+        time.sleep(0.01)
+        self.write_file("Ant", "# Ant")
+        self.assertEqual(util.list_entries(), ["Ant", "Cat"])
+        self.assertNotEqual(util.title_index()[0], generation)
+
+        os.remove(os.path.join(self.directory, "entries", "Cat.md"))
+        self.assertEqual(util.list_entries(), ["Ant"])
+
+
+class RenderCacheTests(WikiTestCase):
+
+    def test_pages_are_rendered_once_per_version(self):
+        util.save_entry("Cat", "# Cat\nMeow")
+        with mock.patch("markdown2.markdown", wraps=markdown2.markdown) as markdown:
+            first = rendering.render_entry("Cat")
+            self.assertEqual(rendering.render_entry("Cat"), first)
+            self.assertEqual(markdown.call_count, 1)
+
+            util.save_entry("Cat", "# Cat\nPurr")
+            self.assertIn("Purr", rendering.render_entry("Cat"))
+            self.assertEqual(markdown.call_count, 2)
+
+    def test_files_changed_outside_the_app_are_rerendered(self):
+        util.save_entry("Cat", "# Cat\nMeow")
+        rendering.render_entry("Cat")
+        self.write_file("Cat", "# Cat\nPurr, purr")
+        self.assertIn("Purr, purr", rendering.render_entry("Cat"))
+
+    def test_missing_entry(self):
+        self.assertIsNone(rendering.render_entry("Cat"))
+
+    def test_cached_page_costs_one_stat(self):
+        util.save_entry("Cat", "# Cat\nMeow")
+        call_command("wiki_reindex", stdout=StringIO())
+        url = reverse("entry", args=["Cat"])
+        self.client.get(url)
+        statements = []
+        indexdb.connect().set_trace_callback(statements.append)
+        self.addCleanup(indexdb.connect().set_trace_callback, None)
+        with mock.patch("os.stat", wraps=os.stat) as stat:
+            response = self.client.get(url)
+        self.assertContains(response, "Meow")
+        self.assertEqual(stat.call_count, 1)
+        # The backlinks, and whether the graph is built and last changed
+        self.assertEqual(len(statements), 2)
+
+
+class EntryCacheTests(WikiTestCase):
+
+    def test_reads_are_cached_until_the_entry_changes(self):
+        util.save_entry("Cat", "# Cat\nMeow")
+        before = util.entry_cache_info()
+        self.assertEqual(util.get_entry("Cat"), "# Cat\nMeow")
+        self.assertEqual(util.get_entry("Cat"), "# Cat\nMeow")
+        after = util.entry_cache_info()
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+        util.save_entry("Cat", "# Cat\nPurr")
+        self.assertEqual(util.get_entry("Cat"), "# Cat\nPurr")
+        self.write_file("Cat", "# Cat\nHiss!")
+        self.assertEqual(util.get_entry("Cat"), "# Cat\nHiss!")
+        self.assertIsNone(util.get_entry("Dog"))
+
+    @override_settings(WIKI_ENTRY_CACHE_BYTES=100)
+    def test_cache_is_bounded_by_size(self):
+        for title in ["Ant", "Bee", "Cat", "Dog"]:
+            util.save_entry(title, title * 10)
+            util.get_entry(title)
+        info = util.entry_cache_info()
+        self.assertLessEqual(info["bytes"], 100)
+        self.assertEqual(info["entries"], 3)
+
+        # Entries larger than the whole budget are never cached
+        util.save_entry("Elk", "Elk" * 50)
+        util.get_entry("Elk")
+        self.assertEqual(util.entry_cache_info()["entries"], 3)
+
+
+class FullTextTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        util.save_entry("Cat", "# Cat\nA cat is a small furry animal. Cats purr.")
+        util.save_entry("Dog", "# Dog\nA dog is a loyal animal that barks.")
+        util.save_entry("Python", "# Python\nPython is a language. Python code is readable.")
+
+    def titles(self, query):
+        return [title for title, _ in fulltext.search(query)]
+
+    def test_ranking(self):
+        self.assertEqual(self.titles("python"), ["Python"])
+        self.assertEqual(sorted(self.titles("animal")), ["Cat", "Dog"])
+        self.assertEqual(self.titles("loyal animal")[0], "Dog")
+        self.assertEqual(self.titles("giraffe"), [])
+        self.assertEqual(self.titles(""), [])
+
+    def test_saves_update_the_index(self):
+        util.save_entry("Dog", "# Dog\nA dog that howls.")
+        self.assertEqual(self.titles("howls"), ["Dog"])
+        self.assertEqual(self.titles("barks"), [])
+        self.assertEqual(self.titles("loyal"), [])
+
+    def test_rebuild_picks_up_outside_changes(self):
+        self.write_file("Ant", "# Ant\nAnts are tiny.")
+        self.assertEqual(self.titles("tiny"), [])
+        call_command("wiki_reindex", stdout=StringIO())
+        self.assertEqual(self.titles("tiny"), ["Ant"])
+
+    def test_search_never_rebuilds(self):
+        shutil.rmtree(os.path.join(self.directory, "entries"))
+        os.makedirs(os.path.join(self.directory, "entries"))
+        self.write_file("Ant", "# Ant\nAnts are tiny.")
+        with override_settings(WIKI_INDEX_DB=os.path.join(self.directory, "other.sqlite3")):
+            with mock.patch.object(fulltext, "rebuild") as rebuild:
+                self.assertEqual(self.titles("tiny"), [])
+            rebuild.assert_not_called()
+
+    def test_length_normalisation_before_reindex(self):
+        util.save_entry("Long", "# Long\nA brass lamp. " + "Polished metal fittings. " * 20)
+        util.save_entry("Short", "# Short\nA brass lamp.")
+        (first, first_score), (second, second_score) = fulltext.search("lamp")
+        self.assertEqual((first, second), ("Short", "Long"))
+        self.assertGreater(first_score, second_score)
+
+    @override_settings(WIKI_SEARCH_POSTINGS_LIMIT=2)
+    def test_postings_limit(self):
+        for i in range(5):
+            util.save_entry(f"Lamp {i}", "# Lamp\n" + "light " * (i + 1) + "brass " * 20)
+        self.assertEqual(len(self.titles("light")), 2)
+
+
+class SubstringSearchTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for title in ["C", "C++", "CSS", "Django", "Python", "Git"]:
+            util.save_entry(title, f"# {title}")
+
+    def test_substring(self):
+        self.assertEqual(titles.substring_search("s"), ["CSS"])
+        self.assertEqual(titles.substring_search("thon"), ["Python"])
+        self.assertEqual(titles.substring_search("c"), ["C", "C++", "CSS"])
+        self.assertEqual(titles.substring_search("ANG"), ["Django"])
+        self.assertEqual(titles.substring_search("xyz"), [])
+
+    def test_query_is_not_a_regular_expression(self):
+        self.assertEqual(titles.substring_search("++"), ["C++"])
+        self.assertEqual(titles.substring_search(".*"), [])
+        self.assertEqual(titles.substring_search("(["), [])
+
+    def test_new_titles_are_searchable(self):
+        self.assertEqual(titles.substring_search("thon"), ["Python"])
+        util.save_entry("Marathon", "# Marathon")
+        self.assertEqual(titles.substring_search("thon"), ["Marathon", "Python"])
+
+    def test_search_view(self):
+        response = self.client.get(reverse("search"), {"q": "py"})
+        self.assertContains(response, "Python")
+        response = self.client.get(reverse("search"), {"q": "python"})
+        self.assertTemplateUsed(response, "encyclopedia/entry.html")
+
+
+class SuggestionTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for title in ["JavaScript", "Python", "Django", "HTML"]:
+            util.save_entry(title, f"# {title}")
+
+    def test_typos_suggest_similar_titles(self):
+        self.assertEqual(titles.suggest("Pyhton")[0], "Python")
+        self.assertEqual(titles.suggest("javscript")[0], "JavaScript")
+        self.assertEqual(titles.suggest("zzzz"), [])
+
+    def test_missing_entry_page_offers_suggestions(self):
+        response = self.client.get(reverse("entry", args=["Djnago"]))
+        self.assertEqual(response.context["suggestions"][0], "Django")
+
+    def test_suggestions_follow_new_titles(self):
+        self.assertNotIn("Pythons", titles.suggest("Pythons"))
+        util.save_entry("Pythons", "# Pythons")
+        self.assertEqual(titles.suggest("Pythons")[0], "Pythons")
+
+
+class RandomEntryTests(WikiTestCase):
+
+    def test_redirects_to_an_entry(self):
+        for title in ["Cat", "Dog"]:
+            util.save_entry(title, f"# {title}")
+        util.list_entries()
+        urls = {reverse("entry", args=[title]) for title in ["Cat", "Dog"]}
+        with mock.patch.object(FileSystemStore, "list_titles") as list_titles:
+            for _ in range(5):
+                response = self.client.get(reverse("random_entry"))
+                self.assertEqual(response.status_code, 302)
+                self.assertIn(response["Location"], urls)
+        # Titles come from the in-memory index, not a directory listing
+        list_titles.assert_not_called()
+
+    def test_no_entries(self):
+        self.assertRedirects(self.client.get(reverse("random_entry")), reverse("index"))
+
+
+class TitleResolutionTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        util.save_entry("CSS", "# CSS")
+        util.save_entry("Machine Learning", "# Machine Learning")
+
+    def test_resolve_ignores_case_and_spacing(self):
+        self.assertEqual(titles.resolve("css"), "CSS")
+        self.assertEqual(titles.resolve(" machine  learning "), "Machine Learning")
+        self.assertIsNone(titles.resolve("HTML"))
+
+    def test_create_rejects_titles_differing_in_case(self):
+        response = self.client.post(reverse("create"), {"title": "css", "contents": "# css"})
+        self.assertContains(response, "already exists")
+        self.assertEqual(util.list_entries(), ["CSS", "Machine Learning"])
+        self.client.post(reverse("create"), {"title": "HTML", "contents": "# HTML"})
+        self.assertEqual(titles.resolve("html"), "HTML")
+
+
+class ConditionalGetTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        util.save_entry("Cat", "# Cat\nMeow")
+
+    def test_entry_not_modified(self):
+        url = reverse("entry", args=["Cat"])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304)
+
+        time.sleep(0.01)
+        util.save_entry("Cat", "# Cat\nPurr")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_entry_modified_by_new_backlinks(self):
+        util.save_entry("Dog", "# Dog\nWoof")
+        call_command("wiki_reindex", stdout=StringIO())
+        url = reverse("entry", args=["Cat"])
+        last_modified = self.client.get(url)["Last-Modified"]
+        util.save_entry("Dog", "# Dog\nWoof")
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+        # HTTP dates are in whole seconds, so the link appears a minute later
+        later = time.time_ns() + 60 * 10**9
+        with mock.patch("time.time_ns", return_value=later):
+            util.save_entry("Dog", "# Dog\nChases the [cat](/wiki/Cat).")
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, reverse("entry", args=["Dog"]))
+
+    def test_index_not_modified(self):
+        url = reverse("index")
+        etag = self.client.get(url)["ETag"]
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        time.sleep(0.01)
+        util.save_entry("Dog", "# Dog")
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+@override_settings(WIKI_INDEX_PAGE_SIZE=2)
+class IndexPaginationTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for title in ["Ant", "Bee", "Cat", "Dog", "Elk"]:
+            util.save_entry(title, f"# {title}")
+
+    def test_title_page(self):
+        self.assertEqual(titles.title_page(limit=2), (["Ant", "Bee"], False, True))
+        self.assertEqual(titles.title_page(after="Bee", limit=2), (["Cat", "Dog"], True, True))
+        self.assertEqual(titles.title_page(after="Dog", limit=2), (["Elk"], True, False))
+        self.assertEqual(titles.title_page(before="Dog", limit=2), (["Bee", "Cat"], True, True))
+        self.assertEqual(titles.title_page(letter="C", limit=2), (["Cat", "Dog"], True, True))
+        self.assertEqual(titles.title_page(letter="Z", limit=2), ([], True, False))
+
+    def test_lowercase_titles_are_paged_with_their_letter(self):
+        util.save_entry("bat", "# bat")
+        util.save_entry("emu", "# emu")
+        self.assertEqual(titles.title_page(letter="B", limit=3), (["bat", "Bee", "Cat"], True, True))
+        self.assertEqual(titles.title_page(after="Elk", limit=2), (["emu"], True, False))
+        response = self.client.get(reverse("index"), {"letter": "b"})
+        self.assertEqual(response.context["entries"], ["bat", "Bee"])
+
+    def test_cursors_follow_through_the_pages(self):
+        url = reverse("index")
+        response = self.client.get(url, {"format": "json"})
+        pages = [response.json()["entries"]]
+        while response.json()["next"]:
+            response = self.client.get(url + response.json()["next"])
+            pages.append(response.json()["entries"])
+        self.assertEqual(pages, [["Ant", "Bee"], ["Cat", "Dog"], ["Elk"]])
+
+        response = self.client.get(url, {"after": "Bee"})
+        self.assertEqual(response.context["entries"], ["Cat", "Dog"])
+        self.assertEqual(response.context["previous_url"], reverse("index") + "?before=Cat")
+        self.assertEqual(response.context["next_url"], reverse("index") + "?after=Dog")
+
+    def test_static_index_pages(self):
+        output = os.path.join(self.directory, "site")
+        call_command("wiki_build", output, stdout=StringIO())
+        pages = {}
+        for number, directory in [(1, "wiki"), (2, "index/2"), (3, "index/3")]:
+            with open(os.path.join(output, directory, "index.html")) as f:
+                pages[number] = f.read()
+        self.assertFalse(os.path.exists(os.path.join(output, "index", "4")))
+        self.assertIn(reverse("entry", args=["Bee"]), pages[1])
+        self.assertNotIn(reverse("entry", args=["Cat"]), pages[1])
+        self.assertIn(reverse("entry", args=["Elk"]), pages[3])
+        self.assertIn('href="/index/2/"', pages[1])
+        self.assertIn(f'href="{reverse("index")}"', pages[2])
+        # Static pages have no query-string links or JSON pages to load
+        for html in pages.values():
+            self.assertNotIn("?letter=", html)
+            self.assertNotIn("?after=", html)
+            self.assertNotIn("?before=", html)
+            self.assertIn('data-next=""', html)
+        self.assertIn('href="/index/2/">C</a>', pages[1])
+
+
+class AutocompleteTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        for title in ["Python", "PyPI", "Perl", "python 2", "Django"]:
+            util.save_entry(title, f"# {title}")
+
+    def test_complete(self):
+        self.assertEqual(titles.complete("py"), ["PyPI", "Python", "python 2"])
+        self.assertEqual(titles.complete("PYTHON "), ["Python", "python 2"])
+        self.assertEqual(titles.complete("py", limit=1), ["PyPI"])
+        self.assertEqual(titles.complete(""), [])
+        util.save_entry("Pyramid", "# Pyramid")
+        self.assertIn("Pyramid", titles.complete("pyr"))
+
+    def test_suggest_view(self):
+        response = self.client.get(reverse("suggest"), {"q": "dj"})
+        self.assertEqual(response.json(), {"suggestions": ["Django"]})
+        self.assertIn("max-age=60", response["Cache-Control"])
+
+
+class SectionRenderingTests(WikiTestCase):
+
+    CONTENT = ("# Page\nIntro\n\n## First\nSee [the docs][docs].\n\n"
+               "## Second\nMore [here][Docs].\n\n[docs]: https://example.com/docs\n")
+
+    def test_reference_links_resolve_in_every_section(self):
+        html, toc = rendering.render_markdown(self.CONTENT)
+        self.assertEqual(html.count('href="https://example.com/docs"'), 2)
+        self.assertEqual(toc, [(2, "First", "first"), (2, "Second", "second")])
+
+    def test_section_fragment(self):
+        util.save_entry("Page", self.CONTENT)
+        url = reverse("entry", args=["Page"])
+        response = self.client.get(url, {"section": "first"})
+        self.assertContains(response, '<a href="https://example.com/docs">the docs</a>')
+        self.assertNotContains(response, "Second")
+        self.assertEqual(self.client.get(url, {"section": "third"}).status_code, 404)
+
+    @override_settings(WIKI_STREAMING_THRESHOLD=10)
+    def test_streamed_pages_match_rendered_pages(self):
+        util.save_entry("Page", self.CONTENT)
+        url = reverse("entry", args=["Page"])
+        self.assertFalse(self.client.get(url, {"section": "first"}).streaming)
+
+        response = self.client.get(url)
+        self.assertTrue(response.streaming)
+        streamed = b"".join(response.streaming_content).decode("utf-8")
+        self.assertIn('href="#second"', streamed)
+        html, _ = rendering.render_markdown(self.CONTENT)
+        self.assertEqual("".join(rendering.iter_entry_html("Page", chunk_size=8)).split(),
+                         html.split())
+
+
+class BacklinkTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        util.save_entry("Cat", "# Cat\nChases [mice](/wiki/Mouse).")
+        util.save_entry("Mouse", "# Mouse\nSqueaks.")
+
+    def test_nothing_is_built_inside_requests(self):
+        with mock.patch.object(links, "rebuild") as rebuild:
+            self.assertEqual(links.backlinks("Mouse"), [])
+            self.assertEqual(links.orphans(), [])
+            self.client.get(reverse("entry", args=["Mouse"]))
+        rebuild.assert_not_called()
+
+    def test_backlinks(self):
+        call_command("wiki_reindex", stdout=StringIO())
+        self.assertEqual(links.backlinks("mouse"), ["Cat"])
+        self.assertEqual(links.orphans(), ["Cat"])
+        util.save_entry("Dog", "# Dog\nSee [cat](/wiki/Cat) and [mouse](/wiki/Mouse).")
+        self.assertEqual(links.backlinks("Mouse"), ["Cat", "Dog"])
+        self.assertEqual(links.orphans(), ["Dog"])
+
+    def test_static_pages_follow_backlinks(self):
+        output = os.path.join(self.directory, "site")
+        call_command("wiki_build", output, stdout=StringIO())
+        util.save_entry("Dog", "# Dog\nSee [cat](/wiki/Cat).")
+        call_command("wiki_build", output, stdout=StringIO())
+        with open(os.path.join(output, "wiki", "Cat", "index.html")) as f:
+            self.assertIn(reverse("entry", args=["Dog"]), f.read())
+
+
+class ImportTests(WikiTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.source = os.path.join(self.directory, "source")
+        os.makedirs(self.source)
+        for filename, data in [("Cat.md", b"# Cat\nCats purr."),
+                               ("Dog.md", b"# Dog\nDogs bark at [cats](/wiki/Cat)."),
+                               ("dog.md", b"# dog\nDogs howl."),
+                               ("Empty.md", b"  \n"),
+                               ("Latin.md", b"# Latin\n\xff")]:
+            with open(os.path.join(self.source, filename), "wb") as f:
+                f.write(data)
+
+    def import_source(self, *args):
+        call_command("wiki_import", self.source, *args,
+                     stdout=StringIO(), stderr=StringIO())
+
+    def test_import(self):
+        util.save_entry("cat", "# Cat\nKept.")
+        with mock.patch("os.fsync") as fsync, mock.patch("os.sync") as sync:
+            self.import_source()
+        fsync.assert_not_called()
+        sync.assert_called_once_with()
+        # Titles differing only in case are the same entry
+        self.assertEqual(util.list_entries(), ["Dog", "cat"])
+        self.assertEqual(util.get_entry("cat"), "# Cat\nKept.")
+        self.assertEqual([title for title, _ in fulltext.search("bark")], ["Dog"])
+        self.assertEqual(fulltext.search("howl"), [])
+        self.assertEqual(len(revisions.history("Dog")), 1)
+        links.rebuild()
+        self.assertEqual(links.backlinks("Cat"), ["Dog"])
+
+    def test_overwrite(self):
+        util.save_entry("cat", "# Cat\nKept.")
+        self.import_source("--overwrite")
+        self.assertEqual(util.list_entries(), ["Dog", "cat"])
+        self.assertEqual(util.get_entry("cat"), "# Cat\nCats purr.")
+        self.assertEqual(util.get_entry("Dog"), "# dog\nDogs howl.")
+        self.assertEqual([title for title, _ in fulltext.search("purr")], ["cat"])
+        self.assertEqual([title for title, _ in fulltext.search("kept")], [])
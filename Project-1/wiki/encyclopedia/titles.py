@@ -0,0 +1,265 @@
+import bisect
+import heapq
+import threading
+from collections import Counter, OrderedDict, defaultdict
+
+from django.dispatch import receiver
+
+from . import util
+from .signals import entry_saved
+
+
+# Longest n-gram stored in the substring index. Queries of at least this
+# length are answered from their n-grams of this size; shorter queries use
+# the shorter grams, which are indexed too.
+MAX_GRAM = 3
+
+# Suggestions scoring below this Dice coefficient are not offered, and at
+# most this many distinct queries keep their suggestions cached.
+MIN_SIMILARITY = 0.3
+SUGGESTION_CACHE_SIZE = 512
+
+
+def normalize(title):
+    """
+    Returns the form of a title used for case- and whitespace-insensitive
+    comparisons.
+    """
+    return " ".join(title.split()).casefold()
+
+
+def _grams(text, n):
+    """
+    Returns the set of substrings of length n in text.
+    """
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _trigrams(text):
+    """
+    Returns the set of trigrams of text padded with spaces, so that short
+    strings and word boundaries still produce grams.
+    """
+    return _grams(f"  {' '.join(text.lower().split())} ", 3)
+
+
+class TitleIndex:
+    """
+    In-memory indexes over the lowercased entry titles. They are derived
+    from util.title_index(), rebuilt when that index is reloaded from disk
+    and updated in place when new entries are saved.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._generation = None
+        self._titles = set()
+        self._canonical = {}
+        self._prefixes = []
+        self._grams = defaultdict(set)
+        self._trigrams = defaultdict(set)
+        self._trigram_counts = {}
+        self._suggestions = OrderedDict()
+
+    def ensure_current(self):
+        """
+        Builds the indexes, or rebuilds them if the titles were reloaded.
+        """
+        generation, titles = util.title_index()
+        if generation != self._generation:
+            with self._lock:
+                if generation != self._generation:
+                    self._build(titles)
+                    self._generation = generation
+
+    def _build(self, titles):
+        self._titles = set()
+        self._canonical = {}
+        self._grams = defaultdict(set)
+        self._trigrams = defaultdict(set)
+        self._trigram_counts = {}
+        self._suggestions.clear()
+        for title in titles:
+            self._add(title)
+        self._prefixes = sorted((normalize(title), title) for title in titles)
+
+    def _add(self, title):
+        self._titles.add(title)
+        self._canonical.setdefault(normalize(title), title)
+        lower = title.lower()
+        for n in range(1, MAX_GRAM + 1):
+            for gram in _grams(lower, n):
+                self._grams[gram].add(title)
+        trigrams = _trigrams(title)
+        self._trigram_counts[title] = len(trigrams)
+        for gram in trigrams:
+            self._trigrams[gram].add(title)
+
+    def add(self, title):
+        """
+        Adds a newly saved title to the indexes if it isn't there already.
+        """
+        with self._lock:
+            if self._generation is not None and title not in self._titles:
+                self._add(title)
+                bisect.insort(self._prefixes, (normalize(title), title))
+                self._suggestions.clear()
+
+    def resolve(self, query):
+        """
+        Returns the title of the entry that query names, ignoring case and
+        surrounding or repeated whitespace, or None if there is none.
+        """
+        self.ensure_current()
+        if query in self._titles:
+            return query
+        return self._canonical.get(normalize(query))
+
+    def complete(self, prefix, limit=10):
+        """
+        Returns up to limit titles starting with prefix, ignoring case and
+        whitespace, in alphabetical order. The titles are kept sorted by
+        their normalized form, so this is a bisect and a short scan.
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        self.ensure_current()
+        with self._lock:
+            i = bisect.bisect_left(self._prefixes, (prefix,))
+            results = []
+            for key, title in self._prefixes[i:i + limit]:
+                if not key.startswith(prefix):
+                    break
+                results.append(title)
+            return results
+
+    def page(self, after=None, before=None, letter=None, limit=100):
+        """
+        Returns a (titles, has_previous, has_next) tuple for one page of
+        the titles in the order of their normalized form, so that case
+        doesn't split the alphabet. The page starts just after the title
+        given as after, ends just before the one given as before, or starts
+        at the first title beginning with letter (or at the first title
+        otherwise).
+        """
+        self.ensure_current()
+        with self._lock:
+            prefixes = self._prefixes
+            if before is not None:
+                end = bisect.bisect_left(prefixes, (normalize(before), before))
+                start = max(0, end - limit)
+            else:
+                if after is not None:
+                    start = bisect.bisect_right(prefixes, (normalize(after), after))
+                elif letter:
+                    start = bisect.bisect_left(prefixes, (normalize(letter),))
+                else:
+                    start = 0
+                end = min(len(prefixes), start + limit)
+            return ([title for _, title in prefixes[start:end]],
+                    start > 0, end < len(prefixes))
+
+    def substring(self, query):
+        """
+        Returns the sorted titles that contain query, ignoring case. Only
+        titles sharing every n-gram of the query are checked, and the query
+        is compared as plain text, never as a regular expression.
+        """
+        query = query.lower()
+        if not query:
+            return []
+        self.ensure_current()
+        n = min(MAX_GRAM, len(query))
+        postings = sorted((self._grams.get(gram, set()) for gram in _grams(query, n)),
+                          key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+        return sorted(title for title in candidates if query in title.lower())
+
+    def similar(self, query, limit=5):
+        """
+        Returns up to limit titles that are most similar to query, ranked by
+        the Dice coefficient of their trigram sets. Results are cached per
+        query until the set of titles changes.
+        """
+        key = (" ".join(query.lower().split()), limit)
+        if not key[0]:
+            return []
+        self.ensure_current()
+        with self._lock:
+            if key in self._suggestions:
+                self._suggestions.move_to_end(key)
+                return self._suggestions[key]
+
+            query_grams = _trigrams(query)
+            shared = Counter()
+            for gram in query_grams:
+                shared.update(self._trigrams.get(gram, ()))
+            scored = []
+            for title, count in shared.items():
+                score = 2 * count / (len(query_grams) + self._trigram_counts[title])
+                if score >= MIN_SIMILARITY:
+                    scored.append((score, title))
+            best = heapq.nlargest(limit, scored, key=lambda item: (item[0], item[1]))
+            results = [title for _, title in best]
+
+            self._suggestions[key] = results
+            while len(self._suggestions) > SUGGESTION_CACHE_SIZE:
+                self._suggestions.popitem(last=False)
+            return results
+
+
+index = TitleIndex()
+
+
+def warm():
+    """
+    Builds the title indexes ahead of the first query.
+    """
+    index.ensure_current()
+
+
+def resolve(query):
+    """
+    Returns the canonical title matching query ignoring case and
+    whitespace, or None if there is no such entry.
+    """
+    return index.resolve(query)
+
+
+def title_page(after=None, before=None, letter=None, limit=100):
+    """
+    Returns a (titles, has_previous, has_next) tuple for one page of the
+    titles in alphabetical order, ignoring case.
+    """
+    return index.page(after, before, letter, limit)
+
+
+def substring_search(query):
+    """
+    Returns the sorted titles that contain query, ignoring case.
+    """
+    return index.substring(query)
+
+
+def complete(prefix, limit=10):
+    """
+    Returns up to limit titles that start with prefix, ignoring case.
+    """
+    return index.complete(prefix, limit)
+
+
+def suggest(query, limit=5):
+    """
+    Returns up to limit titles that look like query, best match first.
+    """
+    return index.similar(query, limit)
+
+
+@receiver(entry_saved)
+def _entry_saved(sender, title, **kwargs):
+    index.add(title)
@@ -5,8 +5,10 @@ from . import views
 urlpatterns = [
     path("wiki/", views.index, name="index"),
     path("wiki/search/", views.search, name="search"),
+    path("wiki/suggest/", views.suggest, name="suggest"),
     path("wiki/create/", views.create, name="create"), 
     path("wiki/random_entry/", views.random_entry, name="random_entry"),
+    path("wiki/orphans/", views.orphans, name="orphans"),
     path("wiki/<str:title>/edit", views.edit, name="edit"),
     path("wiki/<str:title>/", views.entry, name="entry")
 ]
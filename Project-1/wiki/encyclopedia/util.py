@@ -1,40 +1,259 @@
+import bisect
+import random
 import re
+import threading
+from collections import OrderedDict
 
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.utils import validate_file_name
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from . import indexdb, revisions
+from .signals import entry_saved
+
+
+# The entry store in use, created from WIKI_ENTRY_STORE on first use
+_store = None
+
+# Process-wide sorted index of entry titles. It is built on first use,
+# kept current by save_entry and rebuilt whenever the store's version
+# changes, so entries added or removed outside the app still show up.
+_titles = []
+_titles_version = None
+_titles_generation = 0
+_titles_lock = threading.Lock()
+
+# Decoded entry text keyed by title. Each value is a (stamp, content)
+# pair, checked against the entry's current stamp on every read. The cache
+# is bounded by the total size of the cached entries.
+_entry_cache = OrderedDict()
+_entry_cache_bytes = 0
+_entry_cache_hits = 0
+_entry_cache_misses = 0
+_entry_cache_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Returns the configured entry store.
+    """
+    global _store
+    if _store is None:
+        store_class = import_string(getattr(settings, "WIKI_ENTRY_STORE",
+                                            "encyclopedia.stores.FileSystemStore"))
+        _store = store_class(**getattr(settings, "WIKI_ENTRY_STORE_OPTIONS", {}))
+    return _store
+
+
+@receiver(setting_changed)
+def _reset_store(sender, setting, **kwargs):
+    global _store, _titles_version, _entry_cache_bytes
+    if setting in ("WIKI_ENTRY_STORE", "WIKI_ENTRY_STORE_OPTIONS", "MEDIA_ROOT"):
+        with _titles_lock:
+            _store = None
+            _titles_version = None
+        with _entry_cache_lock:
+            _entry_cache.clear()
+            _entry_cache_bytes = 0
+
+
+def entries_version():
+    """
+    Returns a nanosecond timestamp that changes whenever an entry is
+    added, removed or replaced.
+    """
+    return get_store().version()
+
+
+def title_index():
+    """
+    Returns a (generation, titles) pair for the sorted title index,
+    rebuilding it first if the store has changed since it was last read.
+    The generation changes every time the index is rebuilt from the store,
+    so indexes derived from the titles know when to start over. The
+    returned list is shared and must not be modified.
+    """
+    global _titles, _titles_version, _titles_generation
+    version = entries_version()
+    if version != _titles_version:
+        with _titles_lock:
+            if version != _titles_version:
+                _titles = get_store().list_titles()
+                _titles_version = version
+                _titles_generation += 1
+    return _titles_generation, _titles
+
+
+def _add_title(title, was_current):
+    """
+    Inserts a title into the sorted index in place. If the index was
+    current before the write, the new store version is recorded so the
+    app's own saves don't trigger a rescan.
+    """
+    global _titles_version
+    with _titles_lock:
+        if was_current:
+            i = bisect.bisect_left(_titles, title)
+            if i == len(_titles) or _titles[i] != title:
+                _titles.insert(i, title)
+            _titles_version = entries_version()
 
 
 def list_entries():
     """
     Returns a list of all names of encyclopedia entries.
     """
-    _, filenames = default_storage.listdir("entries")
-    return list(sorted(re.sub(r"\.md$", "", filename)
-                for filename in filenames if filename.endswith(".md")))
+    _, titles = title_index()
+    return list(titles)
+
+
+def random_title():
+    """
+    Returns the title of a random entry, or None if there are no entries.
+    """
+    _, titles = title_index()
+    if not titles:
+        return None
+    return random.choice(titles)
+
+
+def validate_title(title):
+    """
+    Raises SuspiciousFileOperation unless the title can safely name an
+    entry file: it may not contain path separators or NUL characters, be
+    "." or "..", or start with a dot.
+    """
+    validate_file_name(title)
+    if "\\" in title or "\0" in title or title.startswith("."):
+        raise SuspiciousFileOperation(f"Invalid entry title '{title}'")
+    return title
 
 
 def save_entry(title, content):
     """
     Saves an encyclopedia entry, given its title and Markdown
     content. If an existing entry with the same title already exists,
-    it is replaced.
+    it is replaced. The entry is replaced atomically while holding a
+    lock on the title, and every save is appended to the entry's
+    revision log. Raises SuspiciousFileOperation if the title could
+    escape the entries directory.
     """
-    filename = f"entries/{title}.md"
-    if default_storage.exists(filename):
-        default_storage.delete(filename)
-    default_storage.save(filename, ContentFile(content))
+    validate_title(title)
+    with revisions.locked(title):
+        was_current = _titles_version == entries_version()
+        get_store().write(title, content)
+        revisions.record(title, content)
+        _add_title(title, was_current)
+        _uncache_entry(title)
+    entry_saved.send(sender=None, title=title, content=content)
+
+
+def save_entries(entries):
+    """
+    Saves a batch of (title, content) pairs as save_entry() would, but
+    flushes the entry files to disk once for the whole batch and commits
+    the search and link index updates made by entry_saved receivers in a
+    single transaction. Every title is validated before anything is
+    written.
+    """
+    entries = list(entries)
+    for title, _ in entries:
+        validate_title(title)
+    store = get_store()
+    with indexdb.transaction():
+        for title, content in entries:
+            with revisions.locked(title):
+                was_current = _titles_version == entries_version()
+                store.write(title, content, sync=False)
+                revisions.record(title, content)
+                _add_title(title, was_current)
+                _uncache_entry(title)
+        store.sync()
+        for title, content in entries:
+            entry_saved.send(sender=None, title=title, content=content)
 
 
 def get_entry(title):
     """
     Retrieves an encyclopedia entry by its title. If no such
-    entry exists, the function returns None.
+    entry exists, the function returns None. Recently read entries
+    are served from memory for as long as their stamp is unchanged.
+    """
+    global _entry_cache_hits, _entry_cache_misses
+    store = get_store()
+    stamp = store.stamp(title)
+    if stamp is None:
+        return None
+    with _entry_cache_lock:
+        cached = _entry_cache.get(title)
+        if cached is not None and cached[0] == stamp:
+            _entry_cache.move_to_end(title)
+            _entry_cache_hits += 1
+            return cached[1]
+        _entry_cache_misses += 1
+
+    content = store.read(title)
+    if content is not None:
+        _cache_entry(title, stamp, content)
+    return content
+
+
+def _cache_entry(title, stamp, content):
+    global _entry_cache_bytes
+    budget = getattr(settings, "WIKI_ENTRY_CACHE_BYTES", 16 * 1024 * 1024)
+    size = stamp[1]
+    if size > budget:
+        return
+    with _entry_cache_lock:
+        old = _entry_cache.pop(title, None)
+        if old is not None:
+            _entry_cache_bytes -= old[0][1]
+        _entry_cache[title] = (stamp, content)
+        _entry_cache_bytes += size
+        while _entry_cache_bytes > budget:
+            _, (old_stamp, _) = _entry_cache.popitem(last=False)
+            _entry_cache_bytes -= old_stamp[1]
+
+
+def _uncache_entry(title):
+    global _entry_cache_bytes
+    with _entry_cache_lock:
+        old = _entry_cache.pop(title, None)
+        if old is not None:
+            _entry_cache_bytes -= old[0][1]
+
+
+def entry_cache_info():
+    """
+    Returns the hit and miss counts and the current size of the entry
+    text cache.
+    """
+    with _entry_cache_lock:
+        return {
+            "hits": _entry_cache_hits,
+            "misses": _entry_cache_misses,
+            "entries": len(_entry_cache),
+            "bytes": _entry_cache_bytes,
+        }
+
+
+def open_entry(title):
+    """
+    Returns a binary file object for reading an entry line by line.
+    Raises FileNotFoundError if no such entry exists.
+    """
+    return get_store().open(title)
+
+
+def entry_stamp(title):
+    """
+    Returns a (mtime, size) pair identifying the current version of an
+    entry, or None if the entry doesn't exist.
     """
-    try:
-        f = default_storage.open(f"entries/{title}.md")
-        return f.read().decode("utf-8")
-    except FileNotFoundError:
-        return None 
+    return get_store().stamp(title)
 
 
 def remove_header(entry, title): 
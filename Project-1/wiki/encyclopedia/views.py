@@ -1,10 +1,20 @@
+import string
+import zlib
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
 from django import forms
-from django.http import HttpResponse
-from django.shortcuts import render
-import markdown2
-from . import util
-import re 
-import random
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (HttpResponse, HttpResponseNotFound, JsonResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import redirect, render
+from django.urls import reverse
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.views.decorators.cache import cache_control, never_cache
+from django.views.decorators.http import condition
+from . import fulltext, links, rendering, titles, util
 
 
 class NewEntryForm(forms.Form): 
@@ -16,59 +26,194 @@ class NewEntryForm(forms.Form):
                                          "placeholder": "Contents...",
                                          "class": "textarea-small"
                                      }))
+
+    def clean_title(self):
+        title = self.cleaned_data["title"]
+        try:
+            return util.validate_title(title)
+        except SuspiciousFileOperation:
+            raise forms.ValidationError("Titles can't contain slashes or start with a dot.")
     
 class EditEntryForm(forms.Form):
     contents = forms.CharField(widget=forms.Textarea(attrs={"rows": 2,
                                                             "cols": 10,  
                                                             "class": "textarea-small"}))
-    def __init__(self, title, *args, **kwargs):
-        entry = util.get_entry(title)
+    def __init__(self, title, *args, entry=None, **kwargs):
+        if entry is None:
+            entry = util.get_entry(title)
         initial_text = util.remove_header(entry, title)
         super().__init__(*args, **kwargs)
 
         self.fields["contents"].initial = initial_text
 
 
+def index_etag(request):
+    return f"{util.entries_version():x}"
+
+
+def index_last_modified(request):
+    return datetime.fromtimestamp(util.entries_version() / 1e9, tz=timezone.utc)
+
+
+def entry_state(request, title):
+    """
+    Returns the entry's (stamp, backlinks, changed) triple, read once per
+    request and shared by the conditional GET checks and the view, so a
+    cached page costs one stat and two index queries.
+    """
+    state = getattr(request, "_entry_state", None)
+    if state is None or state[0] != title:
+        stamp = util.entry_stamp(title)
+        backlinks, changed = links.backlink_state(title) if stamp else ([], None)
+        state = request._entry_state = (title, stamp, backlinks, changed)
+    return state[1:]
+
+
+def entry_etag(request, title):
+    # Changes whenever the entry's file is rewritten or the set of pages
+    # linking to it changes
+    stamp, backlinks, _ = entry_state(request, title)
+    if stamp:
+        backlinks = zlib.crc32("\n".join(backlinks).encode("utf-8"))
+        return f"{stamp[0]:x}-{stamp[1]:x}-{backlinks:x}"
+    return None
+
+
+def entry_last_modified(request, title):
+    # The later of the entry's own change and the last change to the pages
+    # linking to it, which are listed on the page too
+    stamp, _, changed = entry_state(request, title)
+    if stamp:
+        changed = max(stamp[0], changed or 0)
+        return datetime.fromtimestamp(changed / 1e9, tz=timezone.utc)
+    return None
+
+
+@condition(etag_func=index_etag, last_modified_func=index_last_modified)
 def index(request):
+    # Pages are addressed by the titles around them rather than by number,
+    # so each one is a bisect into the sorted title index
+    letter = request.GET.get("letter", "")[:1].upper()
+    entries, has_previous, has_next = titles.title_page(
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+        letter=letter,
+        limit=settings.WIKI_INDEX_PAGE_SIZE)
+    previous_query = urlencode({"before": entries[0]}) if has_previous and entries else None
+    next_query = urlencode({"after": entries[-1]}) if has_next and entries else None
+
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "entries": entries,
+            "previous": f"?{previous_query}&format=json" if previous_query else None,
+            "next": f"?{next_query}&format=json" if next_query else None
+        })
+    index_url = reverse("index")
     return render(request, "encyclopedia/index.html", {
-        "entries": util.list_entries()
+        "entries": entries,
+        "letter": letter,
+        "letter_links": [(l, f"{index_url}?{urlencode({'letter': l})}")
+                         for l in string.ascii_uppercase],
+        "previous_url": f"{index_url}?{previous_query}" if previous_query else None,
+        "next_url": f"{index_url}?{next_query}" if next_query else None,
+        "next_json": f"?{next_query}&format=json" if next_query else None
     }) 
 
 
+@condition(etag_func=entry_etag, last_modified_func=entry_last_modified)
 def entry(request, title): 
-    entry = util.get_entry(title)
-    if entry:
+    # ?section=<slug> returns just that section as an HTML fragment
+    section = request.GET.get("section")
+    if section:
+        fragment = rendering.render_entry_section(title, section)
+        if fragment is None:
+            return HttpResponseNotFound("Error: Section not found")
+        return HttpResponse(fragment)
+
+    stamp, backlinks, _ = entry_state(request, title)
+    if stamp and stamp[1] > rendering.streaming_threshold():
+        return stream_entry(request, title, backlinks)
+
+    page = rendering.render_page(title, stamp) if stamp else None
+    if page:
+        entry, toc = page
         return render(request, "encyclopedia/entry.html", {
             "title": title, 
-            "entry": markdown2.markdown(entry)
+            "entry": entry,
+            "toc": toc,
+            "backlinks": backlinks
         })
-    else: 
-        return render(request, "encyclopedia/error.html") 
+
+    # Send differently cased or spaced titles to the canonical page
+    canonical = titles.resolve(title)
+    if canonical and canonical != title:
+        return redirect("entry", title=canonical)
+    return render(request, "encyclopedia/error.html", {
+        "suggestions": titles.suggest(title)
+    }) 
     
 
+def stream_entry(request, title, backlinks):
+    # Render the page around a marker, send everything before the body
+    # straight away and stream the rendered Markdown in chunks after it.
+    # The table of contents and link definitions come from a quick pass
+    # over the file that doesn't render anything.
+    toc, definitions = rendering.outline_entry(title)
+    marker = "<!-- entry -->"
+    page = render_to_string("encyclopedia/entry.html", {
+        "title": title,
+        "entry": mark_safe(marker),
+        "toc": toc,
+        "backlinks": backlinks
+    }, request)
+    head, tail = page.split(marker, 1)
+
+    def content():
+        yield head
+        yield from rendering.iter_entry_html(title, definitions)
+        yield tail
+
+    return StreamingHttpResponse(content())
+
+
 def search(request): 
-    search_input = request.GET.get("q")
-    entry = util.get_entry(search_input.capitalize()) 
+    search_input = request.GET.get("q", "")
+    title = titles.resolve(search_input)
+    entry = rendering.render_entry(title) if title else None
     if entry: 
         return render(request, "encyclopedia/entry.html", {
-            "title": search_input, 
-            "entry": markdown2.markdown(entry)
+            "title": title, 
+            "entry": entry
         }) 
     else: 
-        entries = util.list_entries()
-        search_output = []
-        
-        for entry in entries: 
-            if re.search(search_input.lower(), entry.lower()):
-                search_output.append(entry)
-        if len(search_output) == 0: 
-            return render(request, "encyclopedia/error.html")
+        search_output = titles.substring_search(search_input)
+        matches = fulltext.search_with_snippets(search_input)
+        if len(search_output) == 0 and len(matches) == 0: 
+            return render(request, "encyclopedia/error.html", {
+                "suggestions": titles.suggest(search_input)
+            })
         return render(request, "encyclopedia/search_results.html", {
             "search": search_input, 
-            "results": search_output
+            "results": search_output,
+            "matches": matches
         })
 
 
+@cache_control(public=True, max_age=60)
+def suggest(request):
+    return JsonResponse({
+        "suggestions": titles.complete(request.GET.get("q", ""),
+                                       settings.WIKI_SUGGEST_LIMIT)
+    })
+
+
+def orphans(request):
+    return render(request, "encyclopedia/orphans.html", {
+        "entries": links.orphans(),
+        "built": links.is_built()
+    })
+
+
 def create(request): 
     if request.method == "POST": 
         form = NewEntryForm(request.POST)
@@ -76,13 +221,14 @@ def create(request):
         if form.is_valid(): 
             title = form.cleaned_data["title"]
             contents = form.cleaned_data["contents"]
-            if util.get_entry(title): 
+            # Titles differing only in case or spacing name the same entry
+            if titles.resolve(title) is not None: 
                 return HttpResponse("Error: Entry title already exists")
             else:
                 util.save_entry(title, contents)
                 return render(request, "encyclopedia/entry.html", {
                     "title": title, 
-                    "entry": markdown2.markdown(contents)
+                    "entry": rendering.render_entry(title)
                 })
         return HttpResponse("Error: Invalid user input")
     return render(request, "encyclopedia/create.html", {
@@ -99,28 +245,23 @@ def edit(request, title):
             
             return render(request, "encyclopedia/entry.html", {
                 "title": title,
-                "entry": markdown2.markdown(contents)
+                "entry": rendering.render_entry(title)
             })
         
     entry = util.get_entry(title) 
     if entry: 
         return render(request, "encyclopedia/edit.html", {
             "title": title,
-            "form": EditEntryForm(title)
+            "form": EditEntryForm(title, entry=entry)
         })
     else: 
         return HttpResponse("Error: Invalid entry")
 
 
+@never_cache
 def random_entry(request): 
-    entries = util.list_entries()
-    r = random.randint(0, len(entries) - 1)
-    title = entries[r]
-    return render(request, "encyclopedia/entry.html", {
-        "title": title,
-        "entry": markdown2.markdown(util.get_entry(title))
-    })
-
-
-
-
+    # Redirect rather than render, so the entry page itself stays cacheable
+    title = util.random_title()
+    if title is None:
+        return redirect("index")
+    return redirect("entry", title=title)
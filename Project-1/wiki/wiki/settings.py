@@ -31,7 +31,7 @@ ALLOWED_HOSTS = []
 # Application definition
 
 INSTALLED_APPS = [
-    'encyclopedia',
+    'encyclopedia.apps.EncyclopediaConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -119,3 +119,54 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Encyclopedia caches and indexes
+
+# Number of rendered entries kept in the in-process LRU. Set
+# WIKI_RENDER_CACHE_BACKEND to the alias of one of CACHES to share
+# rendered pages between processes instead.
+WIKI_RENDER_CACHE_SIZE = 256
+WIKI_RENDER_CACHE_BACKEND = None
+
+# SQLite file holding the full-text search index. It is created on first
+# use and can be rebuilt with `manage.py wiki_reindex`.
+WIKI_INDEX_DB = os.path.join(BASE_DIR, 'wiki_index.sqlite3')
+
+# Every saved entry is appended to a delta-compressed log under revisions/.
+# A full copy is stored every WIKI_REVISION_KEYFRAME_INTERVAL revisions and
+# only the most recent WIKI_REVISION_LIMIT revisions are kept.
+WIKI_REVISION_KEYFRAME_INTERVAL = 20
+WIKI_REVISION_LIMIT = 100
+
+# Entries larger than this many bytes are streamed to the client in
+# rendered chunks instead of being rendered in one piece.
+WIKI_STREAMING_THRESHOLD = 1024 * 1024
+
+# Where entries are kept. FileSystemStore uses one Markdown file per entry
+# under entries/. To use SQLite with FTS5 full-text search instead, run
+# `manage.py wiki_migrate_store` and set
+#     WIKI_ENTRY_STORE = 'encyclopedia.stores.SQLiteStore'
+#     WIKI_ENTRY_STORE_OPTIONS = {'path': os.path.join(BASE_DIR, 'entries.sqlite3')}
+# To keep entries zlib-compressed in one memory-mapped pack file, run
+# `manage.py wiki_pack` and set
+#     WIKI_ENTRY_STORE = 'encyclopedia.stores.PackStore'
+#     WIKI_ENTRY_STORE_OPTIONS = {'path': os.path.join(BASE_DIR, 'entries.pack')}
+WIKI_ENTRY_STORE = 'encyclopedia.stores.FileSystemStore'
+WIKI_ENTRY_STORE_OPTIONS = {}
+
+# Number of titles listed on each page of the index
+WIKI_INDEX_PAGE_SIZE = 100
+
+# Maximum number of completions returned by /wiki/suggest/
+WIKI_SUGGEST_LIMIT = 10
+
+# Number of postings per query term scored by full-text search, strongest
+# first. Larger values rank more precisely at the cost of slower queries.
+WIKI_SEARCH_POSTINGS_LIMIT = 1000
+
+# Total size in bytes of the raw entry text kept in memory by get_entry
+WIKI_ENTRY_CACHE_BYTES = 16 * 1024 * 1024
+
+# Number of individually rendered entry sections kept in memory
+WIKI_SECTION_CACHE_SIZE = 4096
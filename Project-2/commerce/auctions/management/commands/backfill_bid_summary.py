@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from auctions.models import Bid, Listing
+from auctions.summary import bid_summary_values
+
+
+class Command(BaseCommand):
+    help = "Recomputes the stored top bid, top bidder and bid count of every listing."
+
+    def handle(self, *args, **options):
+        # One UPDATE, so bids placed while it runs can't be overwritten with
+        # an older summary
+        updated = Listing.objects.update(**bid_summary_values(Bid))
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} listings."))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from auctions import search
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the full-text search table from every listing."
+
+    def handle(self, *args, **options):
+        if not search.fts_available():
+            raise CommandError("This database has no full-text search table; "
+                               "searches use the LIKE fallback.")
+
+        count = search.rebuild(Listing.objects.only("title", "description", "category").iterator())
+        self.stdout.write(self.style.SUCCESS(f"Indexed {count} listings."))
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from auctions.summary import bid_summary_values
+
+
+# Fills in the new summary columns from the bids already placed, so that
+# existing listings show their top bid and only accept higher ones
+def backfill_bid_summary(apps, schema_editor):
+    Listing = apps.get_model("auctions", "Listing")
+    Bid = apps.get_model("auctions", "Bid")
+    Listing.objects.update(**bid_summary_values(Bid))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0006_listing_is_active_alter_bid_listing_alter_bid_user_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='top_bid_amount',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='top_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leading_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_bid_summary, migrations.RunPython.noop),
+    ]
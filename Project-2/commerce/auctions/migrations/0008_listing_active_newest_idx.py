@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0007_listing_bid_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(fields=['is_active', '-id'], name='listing_active_newest_idx'),
+        ),
+    ]
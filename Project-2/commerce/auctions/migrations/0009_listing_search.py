@@ -0,0 +1,39 @@
+from django.db import DatabaseError, migrations
+
+
+# Creates the FTS5 table used by auctions.search and fills it from the
+# existing listings. Databases without FTS5 are left alone, and searches
+# there fall back to LIKE queries.
+def create_search_table(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE VIRTUAL TABLE IF NOT EXISTS auctions_listing_fts "
+                           "USING fts5(title, description, category)")
+    except DatabaseError:
+        return
+
+    Listing = apps.get_model("auctions", "Listing")
+    rows = [(pk, title, description, category or "") for pk, title, description, category
+            in Listing.objects.values_list("pk", "title", "description", "category")]
+    with connection.cursor() as cursor:
+        cursor.executemany("INSERT INTO auctions_listing_fts (rowid, title, description, category) "
+                           "VALUES (%s, %s, %s, %s)", rows)
+
+
+def drop_search_table(apps, schema_editor):
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS auctions_listing_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0008_listing_active_newest_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_table, drop_search_table),
+    ]
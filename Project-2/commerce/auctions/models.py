@@ -1,12 +1,44 @@
+from collections import namedtuple
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Count, F, OuterRef, Q, Subquery, Value, When
+
+from . import search
+from .summary import bid_summary_values
 
 
 class User(AbstractUser):
     pass
 
 
+class ListingQuerySet(models.QuerySet):
+
+    # Annotates each listing with its highest bid, the user who placed it
+    # (their id and username) and the number of bids, computed in SQL from
+    # the bids table
+    def with_bid_summary(self):
+        top_bids = Bid.objects.filter(listing=OuterRef("pk")).order_by("-bid_amount", "pk")
+        return self.annotate(
+            summary_bid_amount=Subquery(top_bids.values("bid_amount")[:1]),
+            summary_bidder_id=Subquery(top_bids.values("user")[:1]),
+            summary_bidder_username=Subquery(top_bids.values("user__username")[:1]),
+            summary_bid_count=Count("bid"))
+
+    # Returns up to size open listings, newest first, starting below the
+    # listing with primary key before. Served by the (is_active, -id) index,
+    # so the cost doesn't grow with the number of closed listings.
+    def active_page(self, before=None, size=20):
+        listings = self.filter(is_active=True)
+        if before is not None:
+            listings = listings.filter(pk__lt=before)
+        return listings.order_by("-pk")[:size]
+
+
 class Listing(models.Model): 
+    objects = ListingQuerySet.as_manager()
+
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="listings")
     title = models.CharField(max_length=64)
     description = models.CharField(max_length=500)
@@ -14,31 +46,129 @@ class Listing(models.Model):
     image = models.CharField(max_length=1000, blank=True, null=True)
     category = models.CharField(max_length=64, blank=True, null=True)
     is_active = models.BooleanField(default=True)
+
+    # Summary of the bids on this listing, kept up to date by Bid.save so
+    # that list pages don't need a query per listing
+    top_bid_amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    top_bidder = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True,
+                                   related_name="leading_listings")
+    bid_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["is_active", "-id"], name="listing_active_newest_idx"),
+        ]
     
-    # Identifies the highest current bid if it exists
+    # Keeps the listing's search row in step with its text
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or set(update_fields) & set(search.SEARCH_FIELDS):
+            search.index_listing(self)
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        result = super().delete(*args, **kwargs)
+        search.unindex_listing(pk)
+        return result
+
+    # Identifies the highest current bid if it exists, preferring the value
+    # annotated by with_bid_summary when the listing was loaded with it
     @property
     def current_bid(self): 
-        highest = self.bid.order_by("-bid_amount").first()
-        if highest: 
-            return highest.bid_amount
-        return None
-    # Identifies the user with the highest
+        if hasattr(self, "summary_bid_amount"):
+            return self.summary_bid_amount
+        return self.top_bid_amount
+
+    # Identifies the user with the highest bid. When the listing was loaded
+    # with with_bid_summary, the user is built from the annotation, with
+    # only the id and username loaded, instead of being queried
     @property 
     def highest_bidder(self): 
-        highest = self.bid.order_by("-bid_amount").first()
-        if highest: 
-            return highest.user
-        return None
+        if hasattr(self, "summary_bidder_id"):
+            if self.summary_bidder_id is None:
+                return None
+            return User.from_db(self._state.db, ["id", "username"],
+                                [self.summary_bidder_id, self.summary_bidder_username])
+        return self.top_bidder
+
+    # Recomputes the bid summary from the bids themselves. The listing's row
+    # is locked first and the summary computed inside the UPDATE, so a bid
+    # accepted meanwhile can't be overwritten with an older, lower top bid.
+    def refresh_bid_summary(self):
+        with transaction.atomic():
+            listings = Listing.objects.filter(pk=self.pk)
+            list(listings.select_for_update().values_list("pk"))
+            listings.update(**bid_summary_values(Bid))
+        self.refresh_from_db(fields=["top_bid_amount", "top_bidder", "bid_count"])
 
 class WatchList(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="watchlist")
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="watchlist")
 
+# Outcome of Bid.objects.place: whether the bid was accepted, the Bid that
+# was recorded (None if it lost) and the listing's top bid afterwards
+BidResult = namedtuple("BidResult", ["accepted", "bid", "current_bid"])
+
+
+class BidQuerySet(models.QuerySet):
+
+    # Validates and records a bid atomically. The listing's stored top bid is
+    # raised with a conditional UPDATE that only matches while the new amount
+    # still beats it, so of two concurrent bids only a higher one can win and
+    # only the listing's row is locked while it does.
+    def place(self, listing, user, amount):
+        with transaction.atomic():
+            accepted = Listing.objects.filter(pk=listing.pk, is_active=True).filter(
+                Q(top_bid_amount__lt=amount) |
+                Q(top_bid_amount__isnull=True, starting_bid__lte=amount)
+            ).update(top_bid_amount=amount, top_bidder=user, bid_count=F("bid_count") + 1)
+            if not accepted:
+                current_bid = Listing.objects.filter(pk=listing.pk).values_list(
+                    "top_bid_amount", flat=True).first()
+                return BidResult(False, None, current_bid)
+
+            bid = self.model(listing=listing, user=user, bid_amount=amount)
+            bid.save(update_listing=False)
+        return BidResult(True, bid, amount)
+
+
 class Bid(models.Model): 
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="bid")
     bid_amount = models.DecimalField(max_digits=10, decimal_places=2)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="bid")
 
+    objects = BidQuerySet.as_manager()
+
+    # Bids placed through Bid.objects.place have already updated the listing,
+    # and pass update_listing=False
+    def save(self, *args, update_listing=True, **kwargs):
+        if not self._state.adding or not update_listing:
+            return super().save(*args, **kwargs)
+
+        # Record the bid and fold it into the listing's summary in one
+        # transaction. The summary is updated with a single UPDATE that
+        # compares against the stored top bid, so concurrent bids can't
+        # overwrite a higher one.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            is_higher = Q(top_bid_amount__isnull=True) | Q(top_bid_amount__lt=self.bid_amount)
+            Listing.objects.filter(pk=self.listing_id).update(
+                bid_count=F("bid_count") + 1,
+                top_bid_amount=Case(When(is_higher, then=Value(self.bid_amount)),
+                                    default=F("top_bid_amount"),
+                                    output_field=models.DecimalField(max_digits=10,
+                                                                     decimal_places=2)),
+                top_bidder=Case(When(is_higher, then=Value(self.user_id)),
+                                default=F("top_bidder"),
+                                output_field=models.IntegerField()))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self.listing.refresh_bid_summary()
+        return result
+
 class Transaction(models.Model): 
     seller = models.ForeignKey(User, on_delete=models.CASCADE, related_name="transactions_sold")
     buyer = models.ForeignKey(User, on_delete=models.CASCADE, related_name="transactions_bought")
@@ -0,0 +1,143 @@
+import re
+
+from django.db import DatabaseError, connection
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Coalesce
+
+# FTS5 table holding the searchable text of each listing, keyed by the
+# listing's id. It is created by migration 0009 where SQLite supports FTS5.
+FTS_TABLE = "auctions_listing_fts"
+
+# Columns indexed for search, with the bm25 weight of each
+SEARCH_FIELDS = ["title", "description", "category"]
+FTS_WEIGHTS = (10.0, 1.0, 4.0)
+
+# Databases already checked for the FTS table, by name
+_fts_checked = {}
+
+
+# Returns whether the default database has the FTS table
+def fts_available():
+    name = connection.settings_dict["NAME"]
+    if name not in _fts_checked:
+        available = False
+        if connection.vendor == "sqlite":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                               [FTS_TABLE])
+                available = cursor.fetchone() is not None
+        _fts_checked[name] = available
+    return _fts_checked[name]
+
+
+# Splits a query into the words to search for
+def query_terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+# Builds an FTS5 query that matches every term as a prefix. Quoting each term
+# keeps operators typed by the user from being read as FTS syntax.
+def fts_query(terms):
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in terms)
+
+
+# Adds or replaces the search row of a listing
+def index_listing(listing):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [listing.pk])
+        cursor.execute(f"INSERT INTO {FTS_TABLE} (rowid, title, description, category) "
+                       "VALUES (%s, %s, %s, %s)",
+                       [listing.pk, listing.title, listing.description, listing.category or ""])
+
+
+# Removes the search row of a deleted listing
+def unindex_listing(pk):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [pk])
+
+
+# Rebuilds the search table from every listing and returns how many were indexed
+def rebuild(listings):
+    if not fts_available():
+        return 0
+    rows = [(listing.pk, listing.title, listing.description, listing.category or "")
+            for listing in listings]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.executemany(f"INSERT INTO {FTS_TABLE} (rowid, title, description, category) "
+                           "VALUES (%s, %s, %s, %s)", rows)
+    return len(rows)
+
+
+# Returns the ids of up to limit listings matching the query, best first,
+# skipping the first offset. Filtering happens in the same statement so that
+# pages are counted after the filters are applied.
+def _fts_search(terms, active, min_price, max_price, offset, limit):
+    conditions = [f"{FTS_TABLE} MATCH %s"]
+    params = [fts_query(terms)]
+    if active is not None:
+        conditions.append("l.is_active = %s")
+        params.append(active)
+    # Prices are passed as numbers, since SQLite would compare Decimal
+    # parameters as text
+    if min_price is not None:
+        conditions.append("COALESCE(l.top_bid_amount, l.starting_bid) >= %s")
+        params.append(float(min_price))
+    if max_price is not None:
+        conditions.append("COALESCE(l.top_bid_amount, l.starting_bid) <= %s")
+        params.append(float(max_price))
+    weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+    sql = (f"SELECT l.id FROM {FTS_TABLE} JOIN auctions_listing l ON l.id = {FTS_TABLE}.rowid "
+           f"WHERE {' AND '.join(conditions)} "
+           f"ORDER BY bm25({FTS_TABLE}, {weights}), l.id DESC LIMIT %s OFFSET %s")
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params + [limit, offset])
+        return [row[0] for row in cursor.fetchall()]
+
+
+# Fallback for databases without FTS5: every term must appear in one of the
+# fields, and listings are ranked by where the terms appear, weighted as above
+def _fallback_search(listings, terms, offset, limit):
+    score = Value(0)
+    for term in terms:
+        listings = listings.filter(Q(title__icontains=term) | Q(description__icontains=term) |
+                                   Q(category__icontains=term))
+        for field, weight in zip(SEARCH_FIELDS, FTS_WEIGHTS):
+            score = score + Case(When(**{f"{field}__icontains": term}, then=Value(int(weight))),
+                                 default=Value(0), output_field=IntegerField())
+    return list(listings.annotate(search_rank=score)
+                .order_by("-search_rank", "-pk")[offset:offset + limit])
+
+
+# Searches listings for every word of the query. Results can be limited to
+# open or closed listings and to a range of the current price (the top bid,
+# or the starting bid before any bids). Returns up to limit listings, best
+# match first, after skipping offset of them.
+def search_listings(query, active=None, min_price=None, max_price=None, offset=0, limit=20):
+    from .models import Listing
+
+    terms = query_terms(query)
+    if not terms:
+        return []
+
+    if fts_available():
+        try:
+            ids = _fts_search(terms, active, min_price, max_price, offset, limit)
+        except DatabaseError:
+            ids = None
+        if ids is not None:
+            found = Listing.objects.in_bulk(ids)
+            return [found[pk] for pk in ids if pk in found]
+
+    listings = Listing.objects.annotate(price=Coalesce(F("top_bid_amount"), F("starting_bid")))
+    if active is not None:
+        listings = listings.filter(is_active=active)
+    if min_price is not None:
+        listings = listings.filter(price__gte=min_price)
+    if max_price is not None:
+        listings = listings.filter(price__lte=max_price)
+    return _fallback_search(listings, terms, offset, limit)
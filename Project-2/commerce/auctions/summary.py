@@ -0,0 +1,19 @@
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+# Returns the field values that set each listing's stored bid summary (top
+# bid, top bidder and bid count) from its bids, to be passed to a single
+# QuerySet.update(). Computing them inside the UPDATE leaves no window in
+# which a bid can be accepted between reading the bids and writing the
+# summary. The Bid model is passed in so that migrations can use their
+# historical model.
+def bid_summary_values(Bid):
+    bids = Bid.objects.filter(listing=OuterRef("pk"))
+    top_bids = bids.order_by("-bid_amount", "pk")
+    bid_counts = bids.order_by().values("listing").annotate(count=Count("pk")).values("count")
+    return {
+        "top_bid_amount": Subquery(top_bids.values("bid_amount")[:1]),
+        "top_bidder": Subquery(top_bids.values("user")[:1]),
+        "bid_count": Coalesce(Subquery(bid_counts), Value(0)),
+    }
@@ -1,3 +1,274 @@
+from decimal import Decimal
+from importlib import import_module
+from io import StringIO
+from unittest import mock
+
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from django.template import Context, Template
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import search
+from .models import Bid, Listing, User, WatchList
+
+
+class BidSummaryQueryCountTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.client.force_login(self.bidder)
+
+    def add_listings(self, count):
+        for i in range(count):
+            listing = Listing.objects.create(user=self.seller, title=f"Lamp {i}",
+                                             description="A lamp", starting_bid=Decimal("5.00"),
+                                             category="Home")
+            Bid.objects.create(listing=listing, user=self.bidder, bid_amount=Decimal("6.00"))
+            Bid.objects.create(listing=listing, user=self.seller, bid_amount=Decimal("7.50"))
+            WatchList.objects.create(user=self.bidder, listing=listing)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertConstantQueries(self, url):
+        self.add_listings(2)
+        few = self.count_queries(url)
+        self.add_listings(20)
+        many = self.count_queries(url)
+        self.assertEqual(few, many)
+
+    def test_index(self):
+        self.assertConstantQueries(reverse("index"))
+
+    def test_category(self):
+        self.assertConstantQueries(reverse("category", kwargs={"category": "Home"}))
+
+    def test_search(self):
+        self.assertConstantQueries(reverse("search", kwargs={"search_input": "Lamp"}))
+
+    def test_watchlist(self):
+        self.assertConstantQueries(reverse("watchlist"))
+
+    def test_summary_values(self):
+        self.add_listings(1)
+        listing = Listing.objects.with_bid_summary().get()
+        self.assertEqual(listing.summary_bid_amount, Decimal("7.50"))
+        self.assertEqual(listing.summary_bidder_id, self.seller.pk)
+        self.assertEqual(listing.summary_bid_count, 2)
+        self.assertEqual(listing.current_bid, Decimal("7.50"))
+        self.assertEqual(listing.highest_bidder, self.seller)
+
+    def test_highest_bidder_comes_from_the_annotation(self):
+        self.add_listings(3)
+        Listing.objects.create(user=self.seller, title="Chair", description="A chair",
+                               starting_bid=Decimal("5.00"))
+        # Make the stored summary disagree, so only the annotation gives
+        # the right answer
+        Listing.objects.update(top_bidder=self.bidder)
+        template = Template("{% for listing in listings %}"
+                            "{{ listing.highest_bidder.username|default:'-' }},"
+                            "{% endfor %}")
+        with self.assertNumQueries(1):
+            html = template.render(Context({
+                "listings": Listing.objects.with_bid_summary().order_by("pk")}))
+        self.assertEqual(html, "seller,seller,seller,-,")
+
+
+class StoredBidSummaryTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.alice = User.objects.create_user("alice", "alice@example.com", "password")
+        self.bob = User.objects.create_user("bob", "bob@example.com", "password")
+        self.listing = Listing.objects.create(user=self.seller, title="Lamp", description="A lamp",
+                                              starting_bid=Decimal("5.00"))
+
+    def assertSummary(self, amount, bidder, count):
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.top_bid_amount, amount)
+        self.assertEqual(self.listing.top_bidder, bidder)
+        self.assertEqual(self.listing.bid_count, count)
+
+    def test_saving_bids_updates_the_summary(self):
+        self.assertSummary(None, None, 0)
+        Bid.objects.create(listing=self.listing, user=self.alice, bid_amount=Decimal("6.00"))
+        self.assertSummary(Decimal("6.00"), self.alice, 1)
+        Bid.objects.create(listing=self.listing, user=self.bob, bid_amount=Decimal("9.00"))
+        self.assertSummary(Decimal("9.00"), self.bob, 2)
+
+        # A lower bid is counted but doesn't replace the top bid
+        Bid.objects.create(listing=self.listing, user=self.alice, bid_amount=Decimal("8.00"))
+        self.assertSummary(Decimal("9.00"), self.bob, 3)
+
+    def test_deleting_bids_recomputes_the_summary(self):
+        Bid.objects.create(listing=self.listing, user=self.alice, bid_amount=Decimal("6.00"))
+        top = Bid.objects.create(listing=self.listing, user=self.bob, bid_amount=Decimal("9.00"))
+        top.delete()
+        self.assertSummary(Decimal("6.00"), self.alice, 1)
+        Bid.objects.get().delete()
+        self.assertSummary(None, None, 0)
+
+    def test_backfill(self):
+        Bid.objects.create(listing=self.listing, user=self.alice, bid_amount=Decimal("6.00"))
+        Bid.objects.create(listing=self.listing, user=self.bob, bid_amount=Decimal("9.00"))
+        empty = Listing.objects.create(user=self.seller, title="Chair", description="A chair",
+                                       starting_bid=Decimal("5.00"))
+
+        # The migration fills in listings created before the summary existed
+        Listing.objects.update(top_bid_amount=None, top_bidder=None, bid_count=0)
+        migration = import_module("auctions.migrations.0007_listing_bid_summary")
+        migration.backfill_bid_summary(apps, None)
+        self.assertSummary(Decimal("9.00"), self.bob, 2)
+
+        Listing.objects.update(top_bid_amount=Decimal("1.00"), top_bidder=self.seller, bid_count=7)
+        # A single UPDATE, leaving no gap between reading bids and writing
+        with self.assertNumQueries(1):
+            call_command("backfill_bid_summary", stdout=StringIO())
+        self.assertSummary(Decimal("9.00"), self.bob, 2)
+        empty.refresh_from_db()
+        self.assertEqual((empty.top_bid_amount, empty.top_bidder, empty.bid_count), (None, None, 0))
+
+        # With the summary filled in, bids below the existing top bid are refused
+        self.assertFalse(Bid.objects.place(self.listing, self.alice, Decimal("8.00")).accepted)
+
+
+class IndexPaginationTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+
+    def add_listing(self, title, is_active=True):
+        return Listing.objects.create(user=self.seller, title=title, description="A lamp",
+                                      starting_bid=Decimal("5.00"), is_active=is_active)
+
+    @mock.patch("auctions.views.INDEX_PAGE_SIZE", 2)
+    def test_pages_newest_first_without_closed_listings(self):
+        first = self.add_listing("First")
+        self.add_listing("Closed", is_active=False)
+        second = self.add_listing("Second")
+        self.add_listing("Third")
+
+        response = self.client.get(reverse("index"))
+        self.assertEqual([l.title for l in response.context["listings"]], ["Third", "Second"])
+        self.assertEqual(response.context["next_before"], second.pk)
+
+        response = self.client.get(reverse("index"), {"before": second.pk})
+        self.assertEqual(response.context["listings"], [first])
+        self.assertIsNone(response.context["next_before"])
+        self.assertNotContains(response, "Closed")
+
+    def test_invalid_cursor_shows_first_page(self):
+        self.add_listing("Lamp")
+        response = self.client.get(reverse("index"), {"before": "x"})
+        self.assertEqual(len(response.context["listings"]), 1)
+
+
+class PlaceBidTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+        self.listing = Listing.objects.create(user=self.seller, title="Lamp", description="A lamp",
+                                              starting_bid=Decimal("5.00"))
+
+    def test_first_bid_must_meet_starting_bid(self):
+        self.assertFalse(Bid.objects.place(self.listing, self.bidder, Decimal("4.99")).accepted)
+        result = Bid.objects.place(self.listing, self.bidder, Decimal("5.00"))
+        self.assertTrue(result.accepted)
+        self.assertEqual(result.bid.bid_amount, Decimal("5.00"))
+
+    def test_lower_bid_loses(self):
+        Bid.objects.place(self.listing, self.bidder, Decimal("8.00"))
+        result = Bid.objects.place(self.listing, self.seller, Decimal("8.00"))
+        self.assertFalse(result.accepted)
+        self.assertEqual(result.current_bid, Decimal("8.00"))
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.current_bid, Decimal("8.00"))
+        self.assertEqual(self.listing.highest_bidder, self.bidder)
+        self.assertEqual(self.listing.bid_count, 1)
+        self.assertEqual(Bid.objects.count(), 1)
+
+    def test_stale_listing_cannot_accept_lower_bid(self):
+        # Both bidders loaded the listing before either bid was placed
+        stale = Listing.objects.get(pk=self.listing.pk)
+        self.assertTrue(Bid.objects.place(self.listing, self.bidder, Decimal("10.00")).accepted)
+        self.assertFalse(Bid.objects.place(stale, self.seller, Decimal("9.00")).accepted)
+
+    def test_closed_listing_rejects_bids(self):
+        self.listing.is_active = False
+        self.listing.save()
+        self.assertFalse(Bid.objects.place(self.listing, self.bidder, Decimal("50.00")).accepted)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "password")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "password")
+
+    def add_listing(self, title, description="An item", category=None, starting_bid="5.00",
+                    is_active=True):
+        return Listing.objects.create(user=self.seller, title=title, description=description,
+                                      category=category, starting_bid=Decimal(starting_bid),
+                                      is_active=is_active)
+
+    def results(self, query, **params):
+        response = self.client.get(reverse("search", kwargs={"search_input": query}), params)
+        return [listing.title for listing in response.context["listings"]]
+
+    def check_search(self):
+        self.add_listing("Reading chair", description="Comfortable oak lamp stand")
+        self.add_listing("Desk lamp", description="Brass")
+        closed = self.add_listing("Floor lamp", is_active=False)
+        # Matches in the title rank above matches in the description
+        results = self.results("lamp")
+        self.assertEqual(sorted(results[:2]), ["Desk lamp", "Floor lamp"])
+        self.assertEqual(results[2], "Reading chair")
+        self.assertEqual(self.results("oak"), ["Reading chair"])
+        self.assertEqual(self.results("lamp", active="0"), ["Floor lamp"])
+
+        # Prices are the top bid, falling back to the starting bid
+        Bid.objects.place(closed, self.bidder, Decimal("40.00"))
+        self.assertEqual(self.results("lamp", min_price="10"), [])
+        closed.is_active = True
+        closed.save()
+        Bid.objects.place(closed, self.bidder, Decimal("40.00"))
+        self.assertEqual(self.results("lamp", min_price="10", max_price="50"), ["Floor lamp"])
+
+        # Edited listings are found by their new text
+        closed.title = "Floor light"
+        closed.save()
+        self.assertEqual(self.results("light"), ["Floor light"])
+        closed.delete()
+        self.assertEqual(self.results("light", active="1"), [])
+
+    def test_search(self):
+        self.assertTrue(search.fts_available())
+        self.check_search()
+
+    @mock.patch("auctions.search.fts_available", return_value=False)
+    def test_search_fallback(self, fts_available):
+        self.check_search()
+
+    @mock.patch("auctions.views.SEARCH_PAGE_SIZE", 2)
+    def test_pagination(self):
+        for i in range(5):
+            self.add_listing(f"Lamp {i}")
+        self.assertEqual(len(self.results("lamp")), 2)
+        self.assertEqual(len(self.results("lamp", page="3")), 1)
+        response = self.client.get(reverse("search", kwargs={"search_input": "lamp"}),
+                                   {"active": "1", "page": "2"})
+        self.assertEqual(response.context["next_page"], 3)
+        self.assertContains(response, "?active=1&amp;page=3")
 
-# Create your tests here.
+    def test_query_syntax_is_not_interpreted(self):
+        self.add_listing("Lamp")
+        self.assertEqual(self.results('lamp" ('), ["Lamp"])
@@ -1,10 +1,14 @@
+from decimal import Decimal, InvalidOperation
+
 from django.contrib.auth import authenticate, login, logout
 from django.core.exceptions import ValidationError
 from django.db import IntegrityError
+from django.db.models import Prefetch
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
 from django import forms
+from .search import search_listings
 from .util import image_url_checker
 
 
@@ -61,13 +65,10 @@ class MakeBidForm(forms.ModelForm):
     def clean_bid_amount(self): 
         bid = self.cleaned_data["bid_amount"]
 
-        # Query for existing bids for this listing
-        existing_bids = Bid.objects.filter(listing=self.listing)
-        if existing_bids:
-
-            # Find highest bid by ordering the query set
-            highest_bid = existing_bids.order_by("-bid_amount").first().bid_amount
-
+        # Check against the top bid stored on the listing. This only gives
+        # early feedback; Bid.objects.place makes the binding comparison.
+        highest_bid = self.listing.current_bid
+        if highest_bid is not None:
             if bid > highest_bid: 
                 return bid 
             
@@ -82,10 +83,30 @@ class MakeBidForm(forms.ModelForm):
 
         
 
+# Number of listings shown per page of the index
+INDEX_PAGE_SIZE = 20
+
+
 def index(request):
-    
+
+    # Continue below the listing in ?before=, ignoring anything that isn't a key
+    try:
+        before = int(request.GET["before"])
+    except (KeyError, ValueError):
+        before = None
+
+    # Fetch one extra listing to find out whether there is an older page. The
+    # bid shown comes from the listing's stored summary, so no join is needed.
+    listings = list(Listing.objects.active_page(before, INDEX_PAGE_SIZE + 1))
+    next_before = None
+    if len(listings) > INDEX_PAGE_SIZE:
+        listings = listings[:INDEX_PAGE_SIZE]
+        next_before = listings[-1].pk
+
     return render(request, "auctions/index.html", {
-        "listings": Listing.objects.all()
+        "listings": listings,
+        "next_before": next_before,
+        "is_first_page": before is None
     })
 
 
@@ -189,15 +210,51 @@ def search_bar_input(request):
     return HttpResponseRedirect(reverse("index"))
 
 
+# Number of listings shown per page of search results
+SEARCH_PAGE_SIZE = 20
+
+
+# Reads an optional price from the query string, ignoring invalid input
+def price_param(request, name):
+    try:
+        price = Decimal(request.GET.get(name, ""))
+    except InvalidOperation:
+        return None
+    return price if price.is_finite() and price >= 0 else None
+
+
 def search(request, search_input): 
 
-    # Search model for the user input
-    search_results = Listing.objects.filter(title__icontains=search_input)
-    if search_results:
-        return render(request, "auctions/search_results.html", {
-            "listings": search_results
-        }) 
-    return HttpResponse("Error: Listing does not exist")
+    # Filters come from the query string: ?active=1 or 0, ?min_price=,
+    # ?max_price= and the 1-based ?page=
+    active = {"1": True, "0": False}.get(request.GET.get("active"))
+    min_price = price_param(request, "min_price")
+    max_price = price_param(request, "max_price")
+    try:
+        page = max(int(request.GET.get("page", 1)), 1)
+    except ValueError:
+        page = 1
+
+    # Fetch one extra result to find out whether there is a next page
+    listings = search_listings(search_input, active=active, min_price=min_price,
+                               max_price=max_price, offset=(page - 1) * SEARCH_PAGE_SIZE,
+                               limit=SEARCH_PAGE_SIZE + 1)
+    if not listings and page == 1 and active is None and min_price is None and max_price is None:
+        return HttpResponse("Error: Listing does not exist")
+
+    # Query string for the other pages, keeping the filters
+    filters = request.GET.copy()
+    filters.pop("page", None)
+    return render(request, "auctions/search_results.html", {
+        "listings": listings[:SEARCH_PAGE_SIZE],
+        "search_input": search_input,
+        "active": request.GET.get("active", ""),
+        "min_price": min_price,
+        "max_price": max_price,
+        "filters": filters.urlencode(),
+        "previous_page": page - 1 if page > 1 else None,
+        "next_page": page + 1 if len(listings) > SEARCH_PAGE_SIZE else None
+    })
 
 
 def watchlist(request): 
@@ -215,31 +272,36 @@ def watchlist(request):
             pk = request.POST.get("watchlist_pk")
             WatchList.objects.filter(pk=pk, user=request.user).delete()
             
+    watchlist_items = WatchList.objects.filter(user=request.user).prefetch_related(
+        Prefetch("listing", queryset=Listing.objects.with_bid_summary()))
     return render(request, "auctions/watchlist.html", {
-        "watchlist_items": WatchList.objects.filter(user=request.user)})
+        "watchlist_items": watchlist_items})
 
 
 def make_bid(request): 
+    if not request.user.is_authenticated:
+        return HttpResponseRedirect(reverse("login"))
     if request.method == "POST":
         pk = request.POST.get("listing_pk")
         listing = Listing.objects.get(pk=pk)
         form = MakeBidForm(request.POST, listing=listing)
         if form.is_valid():
-            new_bid = form.save(commit=False)
-            new_bid.user = request.user
-            new_bid.listing = listing 
-            new_bid.save()
-            return render(request, "auctions/listing_page.html", {
-                "listing": listing
-            })
+            # Validate and record the bid atomically, since another bid may
+            # have been accepted since the form was checked
+            result = Bid.objects.place(listing, request.user, form.cleaned_data["bid_amount"])
+            listing.refresh_from_db()
+            if result.accepted:
+                return render(request, "auctions/listing_page.html", {
+                    "listing": listing,
+                    "form": MakeBidForm()
+                })
+            form.add_error("bid_amount", f"Bid must be higher than the current bid of {result.current_bid}.")
         return render(request, "auctions/listing_page.html", { 
             "listing": listing,
             "form": form,
             "message": "Invalid bid amount"
         })
-    return render(request, "auctions/listing_page.html", {
-                "listing": listing
-            })
+    return HttpResponseRedirect(reverse("index"))
 
 def sales(request): 
     if request.method == "POST": 
@@ -269,7 +331,7 @@ def purchases(request):
 
 def categories(request, category=None): 
     if category:  
-        listings = Listing.objects.filter(category=category)
+        listings = Listing.objects.filter(category=category).with_bid_summary()
         return render(request, "auctions/categories.html", {
             "selected_category": category,
             "listings": listings